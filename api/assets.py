@@ -0,0 +1,218 @@
+"""
+Раздача собранного фронтенда (каталог static).
+
+Файлы сканируются один раз при старте воркера. Текстовые ресурсы
+отдаются в сжатом виде (br или gzip) по заголовку Accept-Encoding:
+варианты берутся из файлов .br/.gz, подготовленных при сборке образа
+(python assets.py static), а если их нет - сжимаются при старте.
+Небольшие файлы и их сжатые варианты держатся в памяти, остальные
+(в первую очередь source map) читаются с диска. Файлы с хешем
+содержимого в имени кэшируются браузером без перепроверки.
+"""
+import gzip
+import hashlib
+import mimetypes
+import re
+import sys
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import anyio
+import brotli
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from database import config
+from http_cache import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, is_not_modified, not_modified_response
+
+# Сколько байт статики (вместе со сжатыми вариантами) воркер держит в памяти
+ASSETS_MEMORY_LIMIT = int(config.get("ASSETS_MEMORY_LIMIT", 32 * 1024 * 1024))
+# Качество brotli при сжатии во время старта, если файлов .br нет (при сборке - 11)
+ASSETS_RUNTIME_BROTLI_QUALITY = int(config.get("ASSETS_RUNTIME_BROTLI_QUALITY", 5))
+# Файлы меньше этого размера не сжимаются
+ASSETS_MIN_COMPRESS_SIZE = 1024
+
+COMPRESSIBLE_SUFFIXES = frozenset({".html", ".js", ".css", ".map", ".json", ".svg", ".txt", ".ico"})
+# Source map нужны только инструментам разработчика: не занимают память и не сжимаются при старте
+DISK_ONLY_SUFFIXES = frozenset({".map"})
+# Имя сборки Vue CLI с хешем содержимого: app.ee2cdef2.js, chunk-vendors.398321e0.js.map
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[a-z0-9]+(\.map)?$")
+# Кодировки в порядке предпочтения и расширения их файлов
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+mimetypes.add_type("application/json", ".map")
+
+
+class Variant(NamedTuple):
+    """Представление файла в одной кодировке: в памяти (body) или на диске (path)"""
+    etag: str
+    size: int
+    body: Optional[bytes] = None
+    path: Optional[Path] = None
+
+
+class Asset(NamedTuple):
+    media_type: str
+    cache_control: str
+    variants: Dict[str, Variant]
+
+
+def compress(data: bytes, encoding: str, brotli_quality: int = 11) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory: Path) -> int:
+    """
+    Подготовка файлов .br и .gz рядом с исходными при сборке (максимальное
+    сжатие). Возвращает число записанных файлов.
+    """
+    written = 0
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        stat_result = path.stat()
+        if stat_result.st_size < ASSETS_MIN_COMPRESS_SIZE:
+            continue
+        data = None
+        for encoding, extension in ENCODINGS:
+            target = path.with_name(path.name + extension)
+            if target.exists() and target.stat().st_mtime >= stat_result.st_mtime:
+                continue
+            data = data if data is not None else path.read_bytes()
+            target.write_bytes(compress(data, encoding))
+            written += 1
+    return written
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Разбор Accept-Encoding: кодировка -> q"""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header: Optional[str], variants: Dict[str, Variant]) -> str:
+    if header:
+        accepted = accepted_encodings(header)
+        for encoding, _ in ENCODINGS:
+            if encoding in variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+    return "identity"
+
+
+class StaticAssets:
+    """ASGI-приложение раздачи статики со сжатыми вариантами и кэшем в памяти"""
+
+    def __init__(self, directory: str, memory_limit: int = ASSETS_MEMORY_LIMIT):
+        self.directory = Path(directory)
+        self.memory_limit = memory_limit
+        self.memory_size = 0
+        self.hits = 0
+        self.misses = 0
+        self._assets: Optional[Dict[str, Asset]] = None
+        self._lock = anyio.Lock()
+
+    async def load(self) -> None:
+        """Сканирование каталога; вызывается при старте воркера или на первом запросе"""
+        async with self._lock:
+            if self._assets is None:
+                self._assets = await run_in_threadpool(self._scan)
+
+    def _scan(self) -> Dict[str, Asset]:
+        assets = {}
+        self.memory_size = 0
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file() or path.suffix in (".br", ".gz"):
+                continue
+            key = path.relative_to(self.directory).as_posix()
+            assets[key] = self._load_asset(path)
+        return assets
+
+    def _load_asset(self, path: Path) -> Asset:
+        stat_result = path.stat()
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path.name) else REVALIDATE_CACHE_CONTROL
+        in_memory = (
+            path.suffix not in DISK_ONLY_SUFFIXES
+            and self.memory_size + stat_result.st_size <= self.memory_limit
+        )
+
+        if not in_memory:
+            tag = f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+            variants = {"identity": Variant(f'"{tag}"', stat_result.st_size, path=path)}
+            for encoding, extension in ENCODINGS:
+                compressed = path.with_name(path.name + extension)
+                if compressed.exists() and compressed.stat().st_mtime >= stat_result.st_mtime:
+                    variants[encoding] = Variant(f'"{tag}-{encoding}"', compressed.stat().st_size, path=compressed)
+            return Asset(media_type, cache_control, variants)
+
+        data = path.read_bytes()
+        tag = hashlib.sha256(data).hexdigest()[:16]
+        variants = {"identity": Variant(f'"{tag}"', len(data), body=data)}
+        self.memory_size += len(data)
+        if path.suffix in COMPRESSIBLE_SUFFIXES and len(data) >= ASSETS_MIN_COMPRESS_SIZE:
+            for encoding, extension in ENCODINGS:
+                compressed = path.with_name(path.name + extension)
+                if compressed.exists() and compressed.stat().st_mtime >= stat_result.st_mtime:
+                    body = compressed.read_bytes()
+                else:
+                    body = compress(data, encoding, ASSETS_RUNTIME_BROTLI_QUALITY)
+                if len(body) < len(data) and self.memory_size + len(body) <= self.memory_limit:
+                    variants[encoding] = Variant(f'"{tag}-{encoding}"', len(body), body=body)
+                    self.memory_size += len(body)
+        return Asset(media_type, cache_control, variants)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        if self._assets is None:
+            await self.load()
+        response = self.get_response(Request(scope))
+        await response(scope, receive, send)
+
+    def get_response(self, request: Request) -> Response:
+        if request.method not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405)
+
+        key = request.scope["path"].lstrip("/")
+        if key == "" or key.endswith("/"):
+            key += "index.html"
+        asset = self._assets.get(key)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        encoding = choose_encoding(request.headers.get("accept-encoding"), asset.variants)
+        variant = asset.variants[encoding]
+        headers = {"etag": variant.etag, "cache-control": asset.cache_control, "vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+        if is_not_modified(request.headers, variant.etag):
+            return not_modified_response(headers)
+
+        if variant.body is None:
+            self.misses += 1
+            return FileResponse(variant.path, headers=headers, media_type=asset.media_type)
+        self.hits += 1
+        return Response(variant.body, headers=headers, media_type=asset.media_type)
+
+    def stats(self) -> dict:
+        return {"size": self.memory_size, "hits": self.hits, "misses": self.misses}
+
+
+if __name__ == "__main__":
+    target = Path(sys.argv[1] if len(sys.argv) > 1 else "static")
+    print(f"{precompress(target)} compressed files written to {target}")
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, NamedTuple, Optional, TypeVar
+
+from fastapi import Depends, Header
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import async_get_db, config
+from models import User
+
+AUTH_CACHE_SIZE = int(config.get("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(config.get("AUTH_CACHE_TTL", 300))
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CurrentUser(NamedTuple):
+    """Компактная запись аутентифицированного пользователя"""
+    id: int
+    name: str
+
+
+class AuthenticationError(Exception):
+    """Запрос без api-key или с неизвестным api-key"""
+
+
+class TTLCache(Generic[K, V]):
+    """LRU-кэш в памяти процесса с ограничением размера и времени жизни записей"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[K, tuple]" = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key: K, value: V) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+user_cache: TTLCache[str, CurrentUser] = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+async def resolve_api_key(session: AsyncSession, api_key: Optional[str]) -> Optional[CurrentUser]:
+    """Поиск пользователя по api-key: сначала в кэше, затем в базе"""
+
+    if not api_key:
+        return None
+    user = user_cache.get(api_key)
+    if user is None:
+        res = await session.execute(select(User.id, User.name).where(User.api_key == api_key))
+        row = res.first()
+        if row is None:
+            return None
+        user = CurrentUser(row.id, row.name)
+        user_cache.put(api_key, user)
+    return user
+
+
+async def get_current_user(session: AsyncSession = Depends(async_get_db),
+                           api_key: str = Header(None)) -> CurrentUser:
+    """Зависимость FastAPI: пользователь, которому принадлежит api-key запроса"""
+
+    user = await resolve_api_key(session, api_key)
+    if user is None:
+        raise AuthenticationError("Unknown or missing http-header 'Api-key'")
+    return user
@@ -0,0 +1,117 @@
+from typing import Iterable, List, Set
+
+from sqlalchemy import Select, Update, delete, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import config
+from models import Image, User, association_table
+
+# Максимальное число элементов в одном пакетном запросе
+BATCH_MAX_SIZE = int(config.get("BATCH_MAX_SIZE", 100))
+MEDIA_CONFLICT_MESSAGE = "Media not found or attached to another tweet"
+
+
+# Id в таблицах - integer Postgres: большие значения asyncpg не передаст в запрос
+MAX_ID = 2 ** 31 - 1
+
+
+def unique_ids(ids: Iterable[int]) -> List[int]:
+    """Id без повторов в порядке запроса"""
+    return list(dict.fromkeys(ids))
+
+
+def batch_items(ids: List[int], found: Set[int], failed: Set[int], not_found_message: str,
+                failed_type: str = "", failed_message: str = "") -> List[dict]:
+    """Результат пакетной операции по каждому элементу в порядке запроса"""
+
+    items = []
+    for item_id in ids:
+        if item_id not in found:
+            items.append({
+                "id": item_id,
+                "result": False,
+                "error_type": "NotFound",
+                "error_message": not_found_message
+            })
+        elif item_id in failed:
+            items.append({
+                "id": item_id,
+                "result": False,
+                "error_type": failed_type,
+                "error_message": failed_message
+            })
+        else:
+            items.append({"id": item_id, "result": True})
+    return items
+
+
+def follow_statement(user_id: int, author_ids: List[int]) -> Select:
+    """
+    Подписка на нескольких пользователей одним запросом.
+
+    Возвращает по строке (id, changed) на каждого существующего пользователя
+    из списка; changed - была ли подписка создана этим запросом.
+    """
+    inserted = (
+        pg_insert(association_table)
+        .from_select(["subscriber_id", "following_id"], select(literal(user_id), User.id).where(User.id.in_(author_ids)))
+        .on_conflict_do_nothing()
+        .returning(association_table.c.following_id)
+        .cte("inserted")
+    )
+    return (
+        select(User.id, inserted.c.following_id.is_not(None).label("changed"))
+        .outerjoin(inserted, inserted.c.following_id == User.id)
+        .where(User.id.in_(author_ids))
+    )
+
+
+def unfollow_statement(user_id: int, author_ids: List[int]) -> Select:
+    """Отписка от нескольких пользователей одним запросом, результат как у follow_statement"""
+
+    deleted = (
+        delete(association_table)
+        .where(association_table.c.subscriber_id == user_id, association_table.c.following_id.in_(author_ids))
+        .returning(association_table.c.following_id)
+        .cte("deleted")
+    )
+    return (
+        select(User.id, deleted.c.following_id.is_not(None).label("changed"))
+        .outerjoin(deleted, deleted.c.following_id == User.id)
+        .where(User.id.in_(author_ids))
+    )
+
+
+def claim_media_statement(tweet_id: int, media_ids: List[int]) -> Update:
+    """
+    Привязка картинок нового твита: меняются только картинки без твита.
+    Возвращает id привязанных; картинки из списка, которых нет среди них,
+    не существуют или уже привязаны к другому твиту.
+    """
+    return (
+        update(Image)
+        .where(Image.id.in_(media_ids), Image.tweet_id.is_(None))
+        .values(tweet_id=tweet_id)
+        .returning(Image.id)
+    )
+
+
+def attach_media_statement(tweet_id: int, media_ids: List[int]) -> Select:
+    """
+    Привязка нескольких картинок к твиту одним запросом.
+
+    Картинка, уже привязанная к другому твиту, не меняется. Возвращает по
+    строке (id, changed) на каждую существующую картинку из списка.
+    """
+    attached = (
+        update(Image)
+        .where(Image.id.in_(media_ids), or_(Image.tweet_id.is_(None), Image.tweet_id == tweet_id))
+        .values(tweet_id=tweet_id)
+        .returning(Image.id)
+        .cte("attached")
+    )
+    return (
+        select(Image.id, attached.c.id.is_not(None).label("changed"))
+        .outerjoin(attached, attached.c.id == Image.id)
+        .where(Image.id.in_(media_ids))
+    )
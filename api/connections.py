@@ -0,0 +1,94 @@
+import base64
+import binascii
+from typing import Optional, Tuple
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, association_table
+
+# Сколько подписчиков и подписок отдается в профиле пользователя
+CONNECTIONS_PAGE_SIZE = 20
+CONNECTIONS_MAX_PAGE_SIZE = 100
+
+FOLLOWERS = "followers"
+FOLLOWING = "following"
+
+# Для каждого списка: столбец с id владельца профиля и столбец с id пользователей списка
+_DIRECTIONS = {
+    FOLLOWERS: (association_table.c.following_id, association_table.c.subscriber_id),
+    FOLLOWING: (association_table.c.subscriber_id, association_table.c.following_id),
+}
+
+
+def encode_user_cursor(user_id: int) -> str:
+    """Упаковка id последнего пользователя страницы в непрозрачный курсор"""
+    return base64.urlsafe_b64encode(str(user_id).encode()).decode()
+
+
+def decode_user_cursor(cursor: str) -> int:
+    """Распаковка курсора; ValueError, если курсор поврежден"""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("Invalid users cursor") from exc
+
+
+def connections_page_query(user_id: int, direction: str, limit: int, after: Optional[int] = None) -> Select:
+    """
+    Страница подписчиков (direction=followers) или подписок (following) по
+    возрастанию id. Читается диапазон первичного ключа association_table
+    или индекса ix_association_table_following_id и id, name из users.
+    """
+    owner, other = _DIRECTIONS[direction]
+    query = (
+        select(User.id, User.name)
+        .join(association_table, other == User.id)
+        .where(owner == user_id)
+        .order_by(other)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(other > after)
+    return query
+
+
+def connection_counts_query(user_id: int) -> Select:
+    """Число подписчиков и подписок одним запросом (index-only scan по обоим индексам)"""
+    followers = (
+        select(func.count())
+        .select_from(association_table)
+        .where(association_table.c.following_id == user_id)
+        .scalar_subquery()
+    )
+    following = (
+        select(func.count())
+        .select_from(association_table)
+        .where(association_table.c.subscriber_id == user_id)
+        .scalar_subquery()
+    )
+    return select(followers.label("followers_count"), following.label("following_count"))
+
+
+def build_connections_page(rows, limit: int) -> Tuple[list, Optional[str]]:
+    """Пользователи страницы и курсор следующей страницы"""
+    users = [{"id": row.id, "name": row.name} for row in rows]
+    next_cursor = encode_user_cursor(rows[-1].id) if len(rows) == limit else None
+    return users, next_cursor
+
+
+async def get_user_connections(session: AsyncSession, user_id: int,
+                               limit: int = CONNECTIONS_PAGE_SIZE) -> dict:
+    """Счетчики и первые страницы подписчиков и подписок пользователя для профиля"""
+
+    res_counts = await session.execute(connection_counts_query(user_id))
+    counts = res_counts.one()
+    profile = {"followers_count": counts.followers_count, "following_count": counts.following_count}
+    for direction in (FOLLOWERS, FOLLOWING):
+        users, next_cursor = [], None
+        if profile[f"{direction}_count"]:
+            res_users = await session.execute(connections_page_query(user_id, direction, limit))
+            users, next_cursor = build_connections_page(res_users.all(), limit)
+        profile[direction] = users
+        profile[f"{direction}_next_cursor"] = next_cursor
+    return profile
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from sqlalchemy import ScalarSelect, select, update
+
+from database import async_session, config
+from etags import FEED_KEY, bump_versions
+from models import Image
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKERS = int(config.get("MEDIA_WORKERS", min(2, os.cpu_count() or 1)))
+# Сколько заданий может ожидать свободного процесса; остальные откладываются
+MEDIA_QUEUE_SIZE = int(config.get("MEDIA_QUEUE_SIZE", 100))
+
+# Производные картинки: имя -> (максимальная ширина, максимальная высота, формат PIL)
+VARIANTS = {
+    "thumbnail": (160, 160, None),
+    "feed": (680, 2000, None),
+    "webp": (680, 2000, "WEBP"),
+}
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".png", "WEBP": ".webp"}
+
+
+def variant_file_name(content_hash: str, variant: str, image_format: str) -> str:
+    return f"{content_hash}-{variant}{EXTENSIONS.get(image_format, '.png')}"
+
+
+def render_derivatives(source: str, content_hash: str, out_dir: str) -> Dict[str, str]:
+    """
+    Построение уменьшенных копий картинки; выполняется в отдельном процессе.
+
+    Имена файлов зависят только от хеша исходника, поэтому уже построенные
+    копии не пересчитываются. Возвращает имя варианта -> имя файла.
+    """
+    from PIL import Image as PILImage
+
+    result = {}
+    with PILImage.open(source) as original:
+        source_format = original.format
+        original.seek(0)
+        for variant, (width, height, image_format) in VARIANTS.items():
+            image_format = image_format or ("PNG" if source_format == "GIF" else source_format)
+            file_name = variant_file_name(content_hash, variant, image_format)
+            path = Path(out_dir) / file_name
+            if not path.exists():
+                copy = original.copy()
+                if image_format == "JPEG" and copy.mode not in ("RGB", "L"):
+                    copy = copy.convert("RGB")
+                copy.thumbnail((width, height))
+                tmp_path = path.with_name(f".{file_name}.{os.getpid()}")
+                copy.save(tmp_path, format=image_format)
+                os.replace(tmp_path, path)
+            result[variant] = file_name
+    return result
+
+
+def built_derivative(content_hash: str, url_column) -> ScalarSelect:
+    """Ссылка на уже построенную копию файла из любой записи с тем же хешем (или NULL)"""
+    return (
+        select(url_column)
+        .where(Image.content_hash == content_hash, Image.webp_url.is_not(None))
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+class DerivativeWorker:
+    """Фоновая генерация производных картинок в ограниченном пуле процессов"""
+
+    def __init__(self, max_workers: int = MEDIA_WORKERS, queue_size: int = MEDIA_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self._slots = asyncio.Semaphore(max_workers + queue_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._in_progress: Set[str] = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def schedule(self, source: Path, content_hash: str, url_prefix: str) -> None:
+        """Постановка картинки в очередь; повторы одного файла объединяются"""
+        if content_hash in self._in_progress:
+            return
+        self._in_progress.add(content_hash)
+        task = asyncio.get_running_loop().create_task(self._run(source, content_hash, url_prefix))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, source: Path, content_hash: str, url_prefix: str) -> None:
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                files = await loop.run_in_executor(
+                    self.executor, render_derivatives, str(source), content_hash, str(source.parent)
+                )
+            async with async_session() as session:
+                res_updated = await session.execute(
+                    update(Image)
+                    .where(Image.content_hash == content_hash, Image.webp_url.is_(None))
+                    .values(
+                        thumbnail_url=f"{url_prefix}/{files['thumbnail']}",
+                        feed_url=f"{url_prefix}/{files['feed']}",
+                        webp_url=f"{url_prefix}/{files['webp']}",
+                    )
+                    .returning(Image.tweet_id)
+                )
+                # Ссылки на уменьшенные копии видны в ленте, только если картинка уже в твите
+                if any(tweet_id is not None for tweet_id in res_updated.scalars()):
+                    await bump_versions(session, [FEED_KEY])
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to build derivatives for %s", source)
+        finally:
+            self._in_progress.discard(content_hash)
+
+    async def shutdown(self) -> None:
+        """Ожидание начатых заданий и остановка пула процессов"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+derivative_worker = DerivativeWorker()
@@ -0,0 +1,80 @@
+import hashlib
+import random
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import config
+from http_cache import REVALIDATE_CACHE_CONTROL, is_not_modified, not_modified_response
+from models import ChangeVersion
+
+# Глобальная лента: новые и удаленные твиты, лайки, картинки
+FEED_KEY = "feed"
+# Счетчик ленты меняет почти каждая запись, поэтому он разбит на строки feed:0..feed:N-1:
+# транзакция увеличивает одну случайную строку, ETag считается по всем
+FEED_VERSION_SHARDS = int(config.get("FEED_VERSION_SHARDS", 16))
+
+
+def _feed_shard_keys() -> list:
+    return [f"{FEED_KEY}:{shard}" for shard in range(FEED_VERSION_SHARDS)]
+
+
+def user_key(user_id: int) -> str:
+    """Профиль пользователя и его подписки (домашняя лента)"""
+    return f"user:{user_id}"
+
+
+async def bump_versions(session: AsyncSession, keys: Iterable[str]) -> None:
+    """
+    Увеличение счетчиков изменений в текущей транзакции.
+
+    Вызывается последним перед commit: строка счетчика остается
+    заблокированной до конца транзакции. Вместо FEED_KEY увеличивается
+    одна случайная строка счетчика ленты, чтобы записи не ждали друг
+    друга на одной блокировке. Ключи сортируются, чтобы транзакции
+    блокировали строки в одном порядке.
+    """
+    keys = {f"{FEED_KEY}:{random.randrange(FEED_VERSION_SHARDS)}" if key == FEED_KEY else key for key in keys}
+    keys = sorted(keys)
+    if not keys:
+        return
+    upsert = pg_insert(ChangeVersion).values([{"key": key, "version": 1} for key in keys])
+    await session.execute(
+        upsert.on_conflict_do_update(index_elements=["key"], set_={"version": ChangeVersion.version + 1})
+    )
+
+
+async def current_etag(session: AsyncSession, keys: Iterable[str], scope: str = "") -> str:
+    """
+    Слабый ETag представления по счетчикам его ключей.
+
+    Читается до данных ответа: если данные изменились после чтения
+    счетчиков, клиент получит свежие данные со старым ETag и перечитает
+    их при следующем запросе, но не наоборот. scope различает
+    представления одного URL для разных пользователей (/users/me).
+    FEED_KEY учитывает все строки счетчика ленты.
+    """
+    keys = sorted({shard for key in keys for shard in (_feed_shard_keys() if key == FEED_KEY else [key])})
+    res = await session.execute(select(ChangeVersion.key, ChangeVersion.version).where(ChangeVersion.key.in_(keys)))
+    versions: Dict[str, int] = dict(res.tuples().all())
+    state = ";".join(f"{key}={versions.get(key, 0)}" for key in keys)
+    digest = hashlib.blake2b(f"{scope}|{state}".encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_headers(etag: str, vary: Optional[str] = None) -> dict:
+    headers = {"etag": etag, "cache-control": REVALIDATE_CACHE_CONTROL}
+    if vary:
+        headers["vary"] = vary
+    return headers
+
+
+def not_modified(request: Request, headers: dict) -> Optional[Response]:
+    """Ответ 304, если у клиента копия с тем же ETag, иначе None"""
+    if is_not_modified(request.headers, headers["etag"]):
+        return not_modified_response(headers)
+    return None
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional, Set
+
+import asyncpg
+import orjson
+from sqlalchemy import func, select
+
+from database import SQLALCHEMY_DATABASE_URL, config, engine
+
+logger = logging.getLogger(__name__)
+
+# local - события только внутри процесса, postgres - общие для всех воркеров через LISTEN/NOTIFY
+EVENTS_BROKER = config.get("EVENTS_BROKER", "local")
+EVENTS_CHANNEL = config.get("EVENTS_CHANNEL", "feed_events")
+# Сколько событий может ждать отправки одному подписчику
+EVENTS_QUEUE_SIZE = int(config.get("EVENTS_QUEUE_SIZE", 256))
+# Интервал комментариев-пингов в потоке, чтобы прокси не закрывали соединение, сек.
+EVENTS_KEEPALIVE = float(config.get("EVENTS_KEEPALIVE", 15))
+# Ограничение NOTIFY на размер сообщения (8000 байт) с запасом
+NOTIFY_MAX_PAYLOAD = 7900
+
+
+class Subscription:
+    """
+    Очередь событий одного подписчика.
+
+    Очередь ограничена: если подписчик не успевает читать и очередь
+    переполнена, подписка закрывается, а клиент получает событие reset
+    и должен перечитать ленту обычным запросом и переподключиться.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def push(self, event: dict) -> bool:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def close(self) -> None:
+        """Замена непрочитанных событий маркером reset (None)"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class Broker(ABC):
+    """Доставка событий до EventHub всех процессов приложения"""
+
+    @abstractmethod
+    async def publish(self, hub: "EventHub", event: dict) -> None:
+        pass
+
+    async def start(self, hub: "EventHub") -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class LocalBroker(Broker):
+    """События доступны только подписчикам того же процесса"""
+
+    async def publish(self, hub: "EventHub", event: dict) -> None:
+        hub.dispatch(event)
+
+
+class PostgresBroker(Broker):
+    """
+    Общая шина для нескольких воркеров: NOTIFY через пул соединений
+    приложения и LISTEN на выделенном соединении. Событие возвращается и
+    в процесс-отправитель, поэтому локальная рассылка идет только из
+    обработчика уведомлений.
+    """
+
+    def __init__(self, channel: str = EVENTS_CHANNEL):
+        self.channel = channel
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def dsn() -> str:
+        return SQLALCHEMY_DATABASE_URL.set(drivername="postgresql", query={}).render_as_string(hide_password=False)
+
+    async def start(self, hub: "EventHub") -> None:
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+
+            def on_notification(connection, pid, channel, payload):
+                hub.dispatch(orjson.loads(payload))
+
+            def on_termination(connection):
+                logger.warning("Events listener connection lost")
+                hub.reset_all()
+
+            self._connection = await asyncpg.connect(self.dsn())
+            self._connection.add_termination_listener(on_termination)
+            await self._connection.add_listener(self.channel, on_notification)
+
+    async def publish(self, hub: "EventHub", event: dict) -> None:
+        payload = orjson.dumps(event).decode()
+        if len(payload.encode()) > NOTIFY_MAX_PAYLOAD:
+            logger.warning("Event %s is too large for NOTIFY and was dropped", event.get("type"))
+            return
+        await self.start(hub)
+        async with engine.begin() as connection:
+            await connection.execute(select(func.pg_notify(self.channel, payload)))
+
+    async def stop(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+class EventHub:
+    """Рассылка событий ленты подписчикам потока /events"""
+
+    def __init__(self, broker: Broker, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.broker = broker
+        self.queue_size = queue_size
+        self._subscriptions: Set[Subscription] = set()
+
+    async def subscribe(self) -> Subscription:
+        await self.broker.start(self)
+        subscription = Subscription(self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    async def publish(self, event: dict) -> None:
+        """Публикация события; вызывается после фиксации транзакции"""
+        try:
+            await self.broker.publish(self, event)
+        except Exception:
+            # Поток событий - оптимизация: клиент всегда может перечитать ленту
+            logger.exception("Failed to publish event %s", event.get("type"))
+
+    def dispatch(self, event: dict) -> None:
+        """Доставка события в очереди подписчиков процесса без ожидания"""
+        for subscription in list(self._subscriptions):
+            if not subscription.push(event):
+                self.unsubscribe(subscription)
+                subscription.close()
+
+    def reset_all(self) -> None:
+        """Закрытие всех подписок: клиенты перечитают ленту и переподключатся"""
+        for subscription in list(self._subscriptions):
+            subscription.close()
+        self._subscriptions.clear()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    async def shutdown(self) -> None:
+        self.reset_all()
+        await self.broker.stop()
+
+
+def format_sse(event: Optional[dict]) -> bytes:
+    if event is None:
+        return b"event: reset\ndata: {}\n\n"
+    return b"event: " + event["type"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+
+
+async def event_stream(hub: EventHub, keepalive: float = EVENTS_KEEPALIVE) -> AsyncIterator[bytes]:
+    """
+    Поток Server-Sent Events для одной подписки.
+
+    Подписка создается при первом чтении потока и снимается при любом его
+    завершении: если клиент отключился до начала ответа, подписки нет.
+    """
+    subscription = await hub.subscribe()
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            if event is None:
+                return
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def make_broker(name: str = EVENTS_BROKER) -> Broker:
+    if name == "postgres":
+        return PostgresBroker()
+    return LocalBroker()
+
+
+event_hub = EventHub(make_broker())
@@ -0,0 +1,153 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import Select, func, literal_column, select, tuple_
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+
+from models import Image, Like, Tweet, User
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+# Наибольшее значение likes_limit: сколько лайкнувших отдавать у каждого твита
+FEED_LIKES_MAX_LIMIT = 100
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(created_at: datetime, tweet_id: int) -> str:
+    """Упаковка позиции последнего твита страницы в непрозрачный курсор"""
+    raw = f"{created_at.isoformat()}|{tweet_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Распаковка курсора; ValueError, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, tweet_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("Invalid feed cursor") from exc
+
+
+def _empty_json_array():
+    return literal_column("'[]'::json", type_=JSON)
+
+
+def tweet_columns(with_likes: bool = True, likes_limit: Optional[int] = None) -> list:
+    """
+    Столбцы твита для ответа: автор (через join с User), вложения и,
+    при with_likes, лайки.
+
+    Вложения и лайки собираются коррелированными подзапросами в той же
+    строке, поэтому стоимость запроса зависит от размера страницы, а не
+    от размера таблицы твитов. С likes_limit лайков у твита читается не
+    больше likes_limit, и популярный твит не удорожает страницу; без него
+    отдаются все лайкнувшие (фронтенд считает по ним лайки и свой лайк).
+    """
+    # Пока уменьшенные копии не готовы, вместо них отдается оригинал
+    media = (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(
+                func.json_build_object(
+                    "url", Image.url,
+                    "thumbnail", func.coalesce(Image.thumbnail_url, Image.url),
+                    "feed", func.coalesce(Image.feed_url, Image.url),
+                    "webp", func.coalesce(Image.webp_url, Image.url),
+                ),
+                Image.id,
+            ), type_=JSON),
+            _empty_json_array(),
+        ))
+        .where(Image.tweet_id == Tweet.id)
+        .correlate(Tweet)
+        .scalar_subquery()
+    )
+
+    columns = [
+        Tweet.id,
+        Tweet.content,
+        Tweet.created_at,
+        Tweet.like_count,
+        User.id.label("author_id"),
+        User.name.label("author_name"),
+        media.label("media"),
+    ]
+    if with_likes:
+        columns.append(_likes_subquery(likes_limit).label("likes"))
+    return columns
+
+
+def feed_page_query(limit: int, cursor: Optional[Cursor] = None, tweet_ids: Optional[Select] = None,
+                    with_likes: bool = True, likes_limit: Optional[int] = None) -> Select:
+    """
+    Запрос одной страницы ленты.
+
+    Если передан tweet_ids, страница строится только из этих твитов
+    (например, из домашней ленты пользователя). Без with_likes строки
+    likes не читаются, в ответе остается только счетчик like_count.
+    """
+    query = (
+        select(*tweet_columns(with_likes, likes_limit))
+        .join(User, User.id == Tweet.user_id)
+        .order_by(Tweet.created_at.desc(), Tweet.id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        query = query.where(tuple_(Tweet.created_at, Tweet.id) < tuple_(*cursor))
+    if tweet_ids is not None:
+        query = query.where(Tweet.id.in_(tweet_ids))
+    return query
+
+
+def _likes_subquery(limit: Optional[int] = None):
+    like_user = User.__table__.alias("like_user")
+    # Первые limit лайков по индексу ix_likes_tweet_id
+    first_likes = (
+        select(Like.id, like_user.c.id.label("user_id"), like_user.c.name)
+        .join(like_user, like_user.c.id == Like.user_id)
+        .where(Like.tweet_id == Tweet.id)
+        .order_by(Like.id)
+        .limit(limit)
+        .correlate(Tweet)
+        .subquery("first_likes")
+    )
+    return (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(
+                func.json_build_object("user_id", first_likes.c.user_id, "name", first_likes.c.name),
+                first_likes.c.id,
+            ), type_=JSON),
+            _empty_json_array(),
+        ))
+        .select_from(first_likes)
+        .correlate(Tweet)
+        .scalar_subquery()
+    )
+
+
+def tweet_from_row(row) -> dict:
+    """Твит ответа из строки запроса со столбцами tweet_columns"""
+    tweet = {
+        "id": row.id,
+        "content": row.content,
+        "attachments": [item["feed"] for item in row.media],
+        "media": row.media,
+        "author": {"id": row.author_id, "name": row.author_name},
+        "like_count": row.like_count,
+    }
+    if "likes" in row._fields:
+        tweet["likes"] = row.likes
+    return tweet
+
+
+def build_feed_page(rows, limit: int) -> Tuple[list, Optional[str]]:
+    """Преобразование строк запроса в твиты ленты и курсор следующей страницы"""
+    tweets = [tweet_from_row(row) for row in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return tweets, next_cursor
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, column, insert, update, values
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from batch import MEDIA_CONFLICT_MESSAGE
+from database import async_session, config, config_bool
+from etags import FEED_KEY, bump_versions
+from likes import batch_like_statement
+from media import MediaError
+from models import Image, Tweet
+from timeline import NewTweet, fan_out_tweets, fanout_on_read_authors
+
+logger = logging.getLogger(__name__)
+
+# Групповая запись твитов и лайков: запросы накапливаются и сохраняются одной транзакцией
+WRITE_BATCHING = config_bool("WRITE_BATCHING", False)
+# Максимальное число записей в одной транзакции
+WRITE_BATCH_SIZE = int(config.get("WRITE_BATCH_SIZE", 100))
+# Сколько миллисекунд ждать новых записей после первой
+WRITE_BATCH_DELAY_MS = float(config.get("WRITE_BATCH_DELAY_MS", 5))
+
+
+@dataclass
+class PendingTweet:
+    user_id: int
+    content: str
+    media_ids: List[int]
+    future: asyncio.Future = field(repr=False)
+
+
+@dataclass
+class PendingLike:
+    user_id: int
+    tweet_id: int
+    future: asyncio.Future = field(repr=False)
+
+
+class GroupCommitWriter:
+    """
+    Групповая фиксация записей.
+
+    Запросы ставятся в очередь; фоновая задача каждые WRITE_BATCH_DELAY_MS
+    или при накоплении WRITE_BATCH_SIZE записей сохраняет их многострочными
+    запросами в одной транзакции. Запрос получает ответ только после
+    фиксации своей транзакции.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = async_session,
+                 max_size: int = WRITE_BATCH_SIZE, max_delay_ms: float = WRITE_BATCH_DELAY_MS):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.max_delay = max_delay_ms / 1000
+        self._pending: list = []
+        self._has_pending: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def add_tweet(self, user_id: int, content: str, media_ids: Optional[List[int]] = None) -> int:
+        """Добавление твита; возвращает его id после фиксации"""
+        future = asyncio.get_running_loop().create_future()
+        self._submit(PendingTweet(user_id, content, media_ids or [], future))
+        return await future
+
+    async def add_like(self, user_id: int, tweet_id: int) -> Optional[int]:
+        """Отметка «Нравится»; возвращает новый счетчик лайков или None, если твита нет"""
+        future = asyncio.get_running_loop().create_future()
+        self._submit(PendingLike(user_id, tweet_id, future))
+        return await future
+
+    def _submit(self, write) -> None:
+        if self._task is None:
+            self._has_pending = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._pending.append(write)
+        self._has_pending.set()
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._pending:
+                return
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            if not self._closing:
+                if len(self._pending) < self.max_size:
+                    self._full.clear()
+                if not self._pending:
+                    self._has_pending.clear()
+            await self._flush(batch)
+
+    async def _flush(self, batch: list) -> None:
+        """
+        Сохранение группы записей одной транзакцией. Если транзакция не
+        удалась, записи повторяются по одной, и ошибку получает только тот
+        запрос, чья запись ее вызвала (например, лайк от удаленного
+        пользователя), а не все запросы группы.
+        """
+        tweets = [write for write in batch if isinstance(write, PendingTweet)]
+        likes = [write for write in batch if isinstance(write, PendingLike)]
+        try:
+            async with self.session_factory() as session:
+                tweet_ids = await self._write_tweets(session, tweets) if tweets else []
+                like_counts = await self._write_likes(session, likes) if likes else {}
+                # Один счетчик ленты на всю группу записей
+                await bump_versions(session, [FEED_KEY])
+                await session.commit()
+        except Exception as exc:
+            if len(batch) > 1:
+                logger.warning("Group commit of %d writes failed, retrying them one by one", len(batch))
+                for write in batch:
+                    await self._flush([write])
+            elif not batch[0].future.done():
+                batch[0].future.set_exception(exc)
+            return
+
+        for write, tweet_id in zip(tweets, tweet_ids):
+            if not write.future.done():
+                write.future.set_result(tweet_id)
+        for write in likes:
+            if not write.future.done():
+                write.future.set_result(like_counts.get(write.tweet_id))
+
+    @staticmethod
+    async def _write_tweets(session: AsyncSession, tweets: List[PendingTweet]) -> List[int]:
+        on_read = await fanout_on_read_authors(session, {write.user_id for write in tweets})
+        res_tweets = await session.execute(
+            insert(Tweet).returning(Tweet.id, Tweet.created_at, sort_by_parameter_order=True),
+            [
+                {"content": write.content, "user_id": write.user_id, "fanout_on_read": write.user_id in on_read}
+                for write in tweets
+            ],
+        )
+        rows = res_tweets.all()
+        await fan_out_tweets(session, [
+            NewTweet(row.id, write.user_id, row.created_at, write.user_id not in on_read)
+            for write, row in zip(tweets, rows)
+        ])
+
+        attachments = {(media_id, row.id) for write, row in zip(tweets, rows) for media_id in write.media_ids}
+        if attachments:
+            attachment_rows = values(
+                column("media_id", Integer), column("tweet_id", Integer), name="attachment_rows"
+            ).data(sorted(attachments))
+            res_attached = await session.execute(
+                update(Image)
+                .where(Image.id == attachment_rows.c.media_id, Image.tweet_id.is_(None))
+                .values(tweet_id=attachment_rows.c.tweet_id)
+                .returning(Image.id, Image.tweet_id)
+            )
+            # Картинка не существует или уже в другом твите: группа откатывается,
+            # и при повторе по одной ошибку получает только этот твит
+            if len(set(res_attached.tuples().all())) < len(attachments):
+                raise MediaError(MEDIA_CONFLICT_MESSAGE, "Conflict", 409)
+        return [row.id for row in rows]
+
+    @staticmethod
+    async def _write_likes(session: AsyncSession, likes: List[PendingLike]) -> Dict[int, int]:
+        res_likes = await session.execute(batch_like_statement([(write.user_id, write.tweet_id) for write in likes]))
+        return {row.id: row.like_count for row in res_likes}
+
+    async def shutdown(self) -> None:
+        """Сохранение накопленных записей и остановка фоновой задачи"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._has_pending.set()
+        await self._task
+        self._task = None
+        self._closing = False
+
+
+write_batcher = GroupCommitWriter()
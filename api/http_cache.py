@@ -0,0 +1,111 @@
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class RangeNotSatisfiable(Exception):
+    """Запрошенный диапазон лежит за пределами файла"""
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Для If-None-Match используется слабое сравнение (RFC 9110, 13.1.2)
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    Проверка условного запроса: True, если у клиента актуальная копия.
+    If-Modified-Since учитывается только при отсутствии If-None-Match.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def not_modified_response(headers: Mapping[str, str]) -> Response:
+    """Ответ 304 без тела, с валидаторами и заголовками кэширования"""
+    return Response(status_code=304, headers=dict(headers))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбор заголовка Range вида bytes=start-end, bytes=start- или bytes=-suffix.
+
+    Возвращает включительные границы диапазона или None, если заголовок
+    отсутствует, некорректен или содержит несколько диапазонов (тогда
+    отдается весь файл).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start:
+            suffix = int(end)
+            if suffix == 0:
+                raise RangeNotSatisfiable
+            return max(size - suffix, 0), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Ответ 206 с фрагментом файла, читаемым блоками без блокировки event loop"""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path, start: int, end: int, size: int, headers: Optional[dict] = None,
+                 media_type: Optional[str] = None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({
+            **(headers or {}),
+            "content-range": f"bytes {start}-{end}/{size}",
+            "content-length": str(end - start + 1),
+        })
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
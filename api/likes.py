@@ -0,0 +1,144 @@
+from typing import List, Tuple
+
+from sqlalchemy import Integer, Select, Update, column, delete, func, literal, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import Like, Tweet
+from trending import add_likes_cte, remove_likes_cte
+
+
+def like_statement(user_id: int, tweet_id: int) -> Select:
+    """
+    Отметка «Нравится» одним запросом.
+
+    Повторный лайк игнорируется (ON CONFLICT DO NOTHING), и тогда счетчик
+    твита не обновляется. Запрос возвращает строку (id, like_count), если
+    твит существует; like_count - новое значение счетчика или None, если
+    лайк уже стоял. Если твита нет, строк нет.
+    """
+    inserted = (
+        pg_insert(Like)
+        .from_select(["user_id", "tweet_id"], select(literal(user_id), Tweet.id).where(Tweet.id == tweet_id))
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(Like.tweet_id, Like.created_at)
+        .cte("inserted")
+    )
+    counted = (
+        update(Tweet)
+        .where(Tweet.id == tweet_id, select(literal(1)).select_from(inserted).exists())
+        .values(like_count=Tweet.like_count + 1)
+        .returning(Tweet.id, Tweet.like_count)
+        .cte("counted")
+    )
+    return (
+        select(Tweet.id, counted.c.like_count)
+        .outerjoin(counted, counted.c.id == Tweet.id)
+        .where(Tweet.id == tweet_id)
+        .add_cte(add_likes_cte(inserted))
+    )
+
+
+def unlike_statement(user_id: int, tweet_id: int) -> Update:
+    """
+    Снятие отметки «Нравится» одним запросом с уменьшением счетчика твита.
+
+    Возвращает новый like_count или ничего, если лайка (или твита) не было.
+    """
+
+    deleted = (
+        delete(Like)
+        .where(Like.user_id == user_id, Like.tweet_id == tweet_id)
+        .returning(Like.tweet_id, Like.created_at)
+        .cte("deleted")
+    )
+    return (
+        update(Tweet)
+        .where(Tweet.id == tweet_id, select(literal(1)).select_from(deleted).exists())
+        .values(like_count=Tweet.like_count - 1)
+        .returning(Tweet.like_count)
+        .add_cte(remove_likes_cte(deleted))
+    )
+
+
+def _changed_tweets(tweet_ids: List[int], changed, delta: int, scored) -> Select:
+    counted = (
+        update(Tweet)
+        .where(Tweet.id == changed.c.tweet_id)
+        .values(like_count=Tweet.like_count + delta)
+        .returning(Tweet.id)
+        .cte("counted")
+    )
+    return (
+        select(Tweet.id, counted.c.id.is_not(None).label("changed"))
+        .outerjoin(counted, counted.c.id == Tweet.id)
+        .where(Tweet.id.in_(tweet_ids))
+        .add_cte(scored)
+    )
+
+
+def bulk_like_statement(user_id: int, tweet_ids: List[int]) -> Select:
+    """
+    Отметки «Нравится» на несколько твитов одним запросом.
+
+    Возвращает по строке (id, changed) на каждый существующий твит из списка;
+    changed - был ли лайк поставлен этим запросом.
+    """
+    inserted = (
+        pg_insert(Like)
+        .from_select(["user_id", "tweet_id"], select(literal(user_id), Tweet.id).where(Tweet.id.in_(tweet_ids)))
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(Like.tweet_id, Like.created_at)
+        .cte("inserted")
+    )
+    return _changed_tweets(tweet_ids, inserted, 1, add_likes_cte(inserted))
+
+
+def bulk_unlike_statement(user_id: int, tweet_ids: List[int]) -> Select:
+    """Снятие отметок «Нравится» с нескольких твитов одним запросом, результат как у bulk_like_statement"""
+
+    deleted = (
+        delete(Like)
+        .where(Like.user_id == user_id, Like.tweet_id.in_(tweet_ids))
+        .returning(Like.tweet_id, Like.created_at)
+        .cte("deleted")
+    )
+    return _changed_tweets(tweet_ids, deleted, -1, remove_likes_cte(deleted))
+
+
+def batch_like_statement(likes: List[Tuple[int, int]]) -> Select:
+    """
+    Лайки от разных пользователей, (user_id, tweet_id), одним запросом.
+
+    Счетчики твитов увеличиваются на число действительно вставленных строк.
+    Возвращает (id, like_count) существующих твитов из запроса.
+    """
+    like_rows = values(column("user_id", Integer), column("tweet_id", Integer), name="like_rows").data(likes)
+    requested = select(like_rows).cte("requested")
+    inserted = (
+        pg_insert(Like)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(requested.c.user_id, Tweet.id).where(Tweet.id == requested.c.tweet_id),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(Like.tweet_id, Like.created_at)
+        .cte("inserted")
+    )
+    added = (
+        select(inserted.c.tweet_id, func.count().label("added"))
+        .group_by(inserted.c.tweet_id)
+        .subquery("added")
+    )
+    counted = (
+        update(Tweet)
+        .where(Tweet.id == added.c.tweet_id)
+        .values(like_count=Tweet.like_count + added.c.added)
+        .returning(Tweet.id, Tweet.like_count)
+        .cte("counted")
+    )
+    return (
+        select(Tweet.id, func.coalesce(counted.c.like_count, Tweet.like_count).label("like_count"))
+        .outerjoin(counted, counted.c.id == Tweet.id)
+        .where(Tweet.id.in_(select(requested.c.tweet_id)))
+        .add_cte(add_likes_cte(inserted))
+    )
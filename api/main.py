@@ -1,41 +1,107 @@
-import os
-from pathlib import Path
 import random
-import shutil
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from fastapi import FastAPI, Depends, File, Header, UploadFile
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, File, Header, Query, Request, UploadFile
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import delete, insert, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 
-from models import Base, User, Tweet, Image, Like
-from schemas import TweetIn
-from database import engine, async_get_db
+from assets import StaticAssets
+from auth import AuthenticationError, CurrentUser, get_current_user, resolve_api_key, user_cache
+from models import User, Tweet, Image, association_table
+from schemas import (
+    BatchOut, ConnectionsOut, ErrorOut, FeedOut, FollowBatchIn, LikesBatchIn, MediaAttachIn, MediaCreatedOut, ResultOut,
+    SuggestionsOut, TrendingOut, TweetCreatedOut, TweetIn, UserOut, UsersOut
+)
+from database import engine, read_engine, async_get_db, async_get_read_db
+from derivatives import built_derivative, derivative_worker
+from events import event_hub, event_stream
+from group_commit import WRITE_BATCHING, write_batcher
+from metrics import MetricsMiddleware, mark_worker_stopped, metrics_response, register_cache_gauges
+from media import MEDIA_URL_PREFIX, MediaError, media_response, store_upload
+from media_reaper import media_reaper
+from likes import bulk_like_statement, bulk_unlike_statement, like_statement, unlike_statement
+from batch import (
+    BATCH_MAX_SIZE, MAX_ID, MEDIA_CONFLICT_MESSAGE, attach_media_statement, batch_items, claim_media_statement,
+    follow_statement, unfollow_statement, unique_ids
+)
+from connections import (
+    CONNECTIONS_MAX_PAGE_SIZE, CONNECTIONS_PAGE_SIZE, FOLLOWERS, FOLLOWING, build_connections_page,
+    connections_page_query, decode_user_cursor, get_user_connections
+)
+from etags import FEED_KEY, bump_versions, current_etag, etag_headers, not_modified, user_key
+from suggestions import SUGGESTIONS_MAX_SIZE, get_suggestions, suggestion_cache
+from search import SEARCH_MAX_LENGTH, build_search_page, decode_search_cursor, search_order, search_page_query
+from feed import (
+    FEED_LIKES_MAX_LIMIT, FEED_MAX_PAGE_SIZE, FEED_PAGE_SIZE, build_feed_page, decode_cursor, feed_page_query,
+    tweet_from_row
+)
+from trending import TRENDING_MAX_SIZE, current_score, trending_page_query, trending_refresher
+from timeline import (
+    backfill_from_author, backfill_from_authors, fan_out_tweet, home_timeline_ids, is_fanout_on_read,
+    remove_author_from_timeline, remove_authors_from_timeline, timeline_trimmer
+)
 
 app = FastAPI(title="Twitter Clone")
-app_api = FastAPI()
+app_api = FastAPI(default_response_class=ORJSONResponse)
+app_api.add_middleware(MetricsMiddleware, routes=app_api.routes)
+register_cache_gauges("auth", user_cache)
+register_cache_gauges("suggestions", suggestion_cache)
+
+static_assets = StaticAssets(directory="static")
+register_cache_gauges("static", static_assets)
 
 app.mount("/api", app_api)
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
+app.mount("/", static_assets, name="static")
 
 NAMES = ['Tom', 'Anna', 'Jason', 'Samantha', 'Erik', 'George', 'Julia', 'Emma']
 
-OUT_PATH = Path(__file__).parent / 'images'
-
-
-@app.on_event("startup")
-async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
 
-@app.on_event("shutdown")
-async def shutdown(session: AsyncSession = Depends(async_get_db)):
-    await session.close()
-    await engine.dispose()
+@app_api.exception_handler(AuthenticationError)
+async def authentication_error_handler(request: Request, exc: AuthenticationError) -> ORJSONResponse:
+    response = {
+        "result": False,
+        "error_type": "Unauthorized",
+        "error_message": str(exc)
+    }
+    return ORJSONResponse(response, status_code=401)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Жизненный цикл процесса-воркера: свои пул соединений и фоновые задачи.
+
+    Соединения, унаследованные от родительского процесса при fork, не
+    закрываются и не используются: dispose(close=False) только заменяет
+    пул пустым. При остановке сначала сохраняются накопленные записи,
+    затем останавливаются фоновые задачи и закрываются пулы.
+    """
+    for item in {engine, read_engine}:
+        await item.dispose(close=False)
+    await static_assets.load()
+    trending_refresher.start()
+    media_reaper.start()
+    timeline_trimmer.start()
+    try:
+        yield
+    finally:
+        await write_batcher.shutdown()
+        await trending_refresher.shutdown()
+        await media_reaper.shutdown()
+        await timeline_trimmer.shutdown()
+        await event_hub.shutdown()
+        await derivative_worker.shutdown()
+        for item in {engine, read_engine}:
+            await item.dispose()
+        mark_worker_stopped()
+
+
+# FastAPI 0.70 не принимает lifespan в конструкторе; вложенное app_api событий lifespan не получает
+app.router.lifespan_context = lifespan
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -44,276 +110,654 @@ async def get_root() -> HTMLResponse:
     return HTMLResponse("index.html")
 
 
-@app_api.post("/tweets")
+@app_api.get("/metrics", response_class=Response, include_in_schema=False)
+async def get_metrics():
+    """Эндпойнт метрик в формате Prometheus"""
+    return metrics_response()
+
+
+@app_api.get("/events", response_class=StreamingResponse)
+async def stream_feed_events():
+    """
+    Эндпойнт потока событий ленты (Server-Sent Events): tweet_created,
+    tweet_deleted и like_count. Событие reset означает, что клиент отстал:
+    ленту нужно перечитать через /tweets и переподключиться.
+    """
+    return StreamingResponse(
+        event_stream(event_hub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app_api.post("/tweets", status_code=201, response_model=TweetCreatedOut, responses={409: {"model": ErrorOut}})
 async def post_tweet(tweet: TweetIn,
                      session: AsyncSession = Depends(async_get_db),
-                     api_key: str = Header(None)):
+                     current_user: CurrentUser = Depends(get_current_user)):
     """Эндпойнт добавления нового твита"""
 
-    res_user = await session.execute(select(User).filter(User.api_key == api_key))
-    user = res_user.scalar()
-    new_tweet = Tweet(content=tweet.tweet_data, user_id=user.id)
-    session.add(new_tweet)
-    await session.commit()
-
-    if tweet.tweet_media_ids:
-        res = await session.execute(select(Image).filter(
-            Image.id.in_(tweet.tweet_media_ids)
-        ))
-        images = res.scalars().all()
-        for image in images:
-            image.tweet_id = new_tweet.id
+    if WRITE_BATCHING:
+        try:
+            tweet_id = await write_batcher.add_tweet(current_user.id, tweet.tweet_data, tweet.tweet_media_ids)
+        except MediaError as exc:
+            response = {
+                "result": False,
+                "error_type": exc.error_type,
+                "error_message": str(exc)
+            }
+            return ORJSONResponse(response, status_code=exc.status_code)
+    else:
+        fanout_on_read = await is_fanout_on_read(session, current_user.id)
+        res_tweet = await session.execute(
+            insert(Tweet).values(
+                content=tweet.tweet_data, user_id=current_user.id, fanout_on_read=fanout_on_read
+            ).returning(Tweet.id, Tweet.created_at)
+        )
+        tweet_id, created_at = res_tweet.one()
+        await fan_out_tweet(session, tweet_id, current_user.id, created_at, to_followers=not fanout_on_read)
+
+        if tweet.tweet_media_ids:
+            media_ids = unique_ids(tweet.tweet_media_ids)
+            res_media = await session.execute(claim_media_statement(tweet_id, media_ids))
+            if len(res_media.all()) < len(media_ids):
+                await session.rollback()
+                response = {
+                    "result": False,
+                    "error_type": "Conflict",
+                    "error_message": MEDIA_CONFLICT_MESSAGE
+                }
+                return ORJSONResponse(response, status_code=409)
+        await bump_versions(session, [FEED_KEY])
         await session.commit()
 
-    response = {"result": True, "tweet_id": new_tweet.id}
-    return JSONResponse(content=jsonable_encoder(response), status_code=201)
+    await event_hub.publish({
+        "type": "tweet_created",
+        "tweet": {
+            "id": tweet_id,
+            "content": tweet.tweet_data,
+            "author": {"id": current_user.id, "name": current_user.name},
+            "media_ids": tweet.tweet_media_ids or [],
+        },
+    })
+
+    response = {"result": True, "tweet_id": tweet_id}
+    return ORJSONResponse(response, status_code=201)
 
 
-@app_api.post("/medias")
+@app_api.post("/medias", status_code=201, response_model=MediaCreatedOut,
+              responses={413: {"model": ErrorOut}, 415: {"model": ErrorOut}})
 async def download_image_from_tweet(file: UploadFile = File(...),
                                     session: AsyncSession = Depends(async_get_db),
                                     api_key: str = Header(None)):
     """Эндпойнт для загрузки картинок из твита"""
 
-    os.makedirs(OUT_PATH, exist_ok=True)
+    try:
+        stored = await store_upload(file)
+    except MediaError as exc:
+        response = {
+            "result": False,
+            "error_type": exc.error_type,
+            "error_message": str(exc)
+        }
+        return ORJSONResponse(response, status_code=exc.status_code)
+
+    # Каждая загрузка - отдельная запись (картинка может быть только в одном твите),
+    # одинаковые файлы хранятся один раз, уже построенные копии переиспользуются
+    res_media = await session.execute(
+        insert(Image).values(
+            url=stored.url,
+            content_hash=stored.content_hash,
+            content_type=stored.content_type,
+            size=stored.size,
+            thumbnail_url=built_derivative(stored.content_hash, Image.thumbnail_url),
+            feed_url=built_derivative(stored.content_hash, Image.feed_url),
+            webp_url=built_derivative(stored.content_hash, Image.webp_url),
+        ).returning(Image.id, Image.webp_url)
+    )
+    media = res_media.one()
+    await session.commit()
+    if media.webp_url is None:
+        derivative_worker.schedule(stored.path, stored.content_hash, MEDIA_URL_PREFIX)
 
-    file_path = "{}/{}".format(OUT_PATH, file.filename)
-    with open(file_path, mode='wb') as f:
-        shutil.copyfileobj(file.file, f)
+    response = {"result": True, "media_id": media.id}
+    return ORJSONResponse(response, status_code=201)
 
 
-    new_image = Image(url=f"api{file_path}")
-    session.add(new_image)
+@app_api.get("/api/images/{file_name}")
+async def get_image_from_dir(file_name: str, request: Request):
+    """Эндпойнт для загрузки сохраненных картинок в ленту с твитами"""
+    return await media_response(request, file_name)
+
+
+# Пакетные эндпойнты объявлены до /tweets/{tweet_id}, иначе DELETE /tweets/likes попадет в удаление твита
+@app_api.post("/tweets/likes", response_model=BatchOut)
+async def like_tweets_batch(batch: LikesBatchIn,
+                            session: AsyncSession = Depends(async_get_db),
+                            current_user: CurrentUser = Depends(get_current_user)):
+    """Эндпойнт, который позволяет поставить отметку «Нравится» сразу на несколько твитов"""
+
+    tweet_ids = unique_ids(batch.tweet_ids)
+    res_likes = await session.execute(bulk_like_statement(current_user.id, tweet_ids))
+    rows = res_likes.all()
+    found = {row.id for row in rows}
+    if any(row.changed for row in rows):
+        await bump_versions(session, [FEED_KEY])
     await session.commit()
 
-    response = {"result": True, "media_id": new_image.id}
-    return JSONResponse(content=jsonable_encoder(response), status_code=201)
+    items = batch_items(tweet_ids, found, set(), "Tweet not found")
+    return ORJSONResponse({"result": True, "items": items})
 
 
-@app_api.get("/api/images/{file_name}")
-async def get_image_from_dir(file_name: str):
-    """Эндпойнт для загрузки сохраненных картинок в ленту с твитами"""
-    file_path = f"images/{file_name}"
-    return FileResponse(file_path)
+@app_api.delete("/tweets/likes", response_model=BatchOut)
+async def delete_likes_batch(batch: LikesBatchIn,
+                             session: AsyncSession = Depends(async_get_db),
+                             current_user: CurrentUser = Depends(get_current_user)):
+    """Эндпойнт, который позволяет убрать отметку «Нравится» сразу с нескольких твитов"""
 
+    tweet_ids = unique_ids(batch.tweet_ids)
+    res_likes = await session.execute(bulk_unlike_statement(current_user.id, tweet_ids))
+    rows = res_likes.all()
+    found = {row.id for row in rows}
+    if any(row.changed for row in rows):
+        await bump_versions(session, [FEED_KEY])
+    await session.commit()
 
-@app_api.delete("/tweets/{tweet_id}")
-async def delete_tweet_by_id(tweet_id: int, session: AsyncSession = Depends(async_get_db), api_key: str = Header(None)):
-    """Эндпойнт для удаления пользователем своего твита по id"""
+    items = batch_items(tweet_ids, found, set(), "Tweet not found")
+    return ORJSONResponse({"result": True, "items": items})
 
-    res_user = await session.execute(select(User).filter(User.api_key == api_key))
-    user = res_user.scalar()
 
-    res_tweet = await session.execute(select(Tweet).filter(
-        Tweet.id == tweet_id, Tweet.user_id == user.id
-    ))
-    tweet = res_tweet.scalar()
+@app_api.post("/tweets/{tweet_id}/medias", response_model=BatchOut, responses={400: {"model": ErrorOut}})
+async def attach_medias_to_tweet(tweet_id: int,
+                                 batch: MediaAttachIn,
+                                 session: AsyncSession = Depends(async_get_db),
+                                 current_user: CurrentUser = Depends(get_current_user)):
+    """Эндпойнт для привязки нескольких загруженных картинок к своему твиту"""
 
-    if not tweet:
+    own_tweet = await session.scalar(
+        select(Tweet.id).where(Tweet.id == tweet_id, Tweet.user_id == current_user.id)
+    )
+    if own_tweet is None:
+        response = {
+            "result": False,
+            "error_type": "PermissionError",
+            "error_message": "User does not have permission to edit the tweet"
+        }
+        return ORJSONResponse(response, status_code=400)
+
+    media_ids = unique_ids(batch.media_ids)
+    res_media = await session.execute(attach_media_statement(tweet_id, media_ids))
+    rows = res_media.all()
+    if any(row.changed for row in rows):
+        await bump_versions(session, [FEED_KEY])
+    await session.commit()
+
+    items = batch_items(
+        media_ids,
+        found={row.id for row in rows},
+        failed={row.id for row in rows if not row.changed},
+        not_found_message="Media not found",
+        failed_type="Conflict",
+        failed_message="Media is attached to another tweet",
+    )
+    return ORJSONResponse({"result": True, "items": items})
+
+
+@app_api.delete("/tweets/{tweet_id}", response_model=ResultOut, responses={400: {"model": ErrorOut}})
+async def delete_tweet_by_id(tweet_id: int,
+                             session: AsyncSession = Depends(async_get_db),
+                             current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Эндпойнт для удаления пользователем своего твита по id.
+    Лайки, записи лент и trending удаляет база (ON DELETE CASCADE), картинки
+    отвязываются и вместе с файлами удаляются фоновым MediaReaper.
+    """
+
+    res_tweet = await session.execute(
+        delete(Tweet).where(Tweet.id == tweet_id, Tweet.user_id == current_user.id).returning(Tweet.id)
+    )
+
+    if res_tweet.scalar() is None:
         response = {
             "result": False,
             "error_type": "PermissionError",
             "error_message": "User does not have permission to delete the tweet"
         }
-        return JSONResponse(content=jsonable_encoder(response), status_code=400)
+        return ORJSONResponse(response, status_code=400)
 
-    await session.delete(tweet)
+    await bump_versions(session, [FEED_KEY])
     await session.commit()
+    await event_hub.publish({"type": "tweet_deleted", "tweet_id": tweet_id})
 
-    return {"result": True}
+    return ORJSONResponse({"result": True})
 
 
-@app_api.post("/tweets/{tweet_id}/likes")
+@app_api.post("/tweets/{tweet_id}/likes", status_code=201, response_model=ResultOut,
+              responses={404: {"model": ErrorOut}})
 async def like_tweet(tweet_id: int,
                      session: AsyncSession = Depends(async_get_db),
-                     api_key: str = Header(None)):
+                     current_user: CurrentUser = Depends(get_current_user)):
     """Эндпойнт, который позволяет пользователю поставить отметку «Нравится» на твит"""
 
-    res_user = await session.execute(select(User).filter(User.api_key == api_key))
-    user = res_user.scalar()
-
-    res_tweet = await session.execute(select(Tweet).filter(Tweet.id == tweet_id))
-    tweet = res_tweet.scalar()
+    if WRITE_BATCHING:
+        like_count = await write_batcher.add_like(current_user.id, tweet_id)
+        found = like_count is not None
+    else:
+        res_like = await session.execute(like_statement(current_user.id, tweet_id))
+        liked = res_like.first()
+        found = liked is not None
+        # like_count пуст, если лайк уже стоял: ни ленту, ни подписчиков событий это не меняет
+        like_count = liked.like_count if found else None
+        if like_count is not None:
+            await bump_versions(session, [FEED_KEY])
+        await session.commit()
+    if not found:
+        response = {
+            "result": False,
+            "error_type": "NotFound",
+            "error_message": "Tweet not found"
+        }
+        return ORJSONResponse(response, status_code=404)
 
-    like = Like(user_id=user.id, tweet_id=tweet.id)
-    session.add(like)
-    await session.commit()
+    if like_count is not None:
+        await event_hub.publish({"type": "like_count", "tweet_id": tweet_id, "like_count": like_count})
 
     response = {"result": True}
-    return JSONResponse(content=jsonable_encoder(response), status_code=201)
+    return ORJSONResponse(response, status_code=201)
 
 
-@app_api.delete("/tweets/{tweet_id}/likes")
+@app_api.delete("/tweets/{tweet_id}/likes", response_model=ResultOut)
 async def delete_like_from_tweet(tweet_id: int,
                                  session: AsyncSession = Depends(async_get_db),
-                                 api_key: str = Header(None)):
+                                 current_user: CurrentUser = Depends(get_current_user)):
     """Эндпойнт, который позволяет пользователю убрать отметку «Нравится» с твита"""
 
-    res_user = await session.execute(select(User).filter(User.api_key == api_key))
-    user = res_user.scalar()
+    res_unlike = await session.execute(unlike_statement(current_user.id, tweet_id))
+    like_count = res_unlike.scalar()
+    if like_count is not None:
+        await bump_versions(session, [FEED_KEY])
+    await session.commit()
+    if like_count is not None:
+        await event_hub.publish({"type": "like_count", "tweet_id": tweet_id, "like_count": like_count})
+
+    return ORJSONResponse({"result": True})
 
-    res_like = await session.execute(select(Like).filter(
-        Like.tweet_id == tweet_id, Like.user_id == user.id
-    ))
-    like = res_like.scalar()
 
-    await session.delete(like)
+@app_api.post("/users/follow", response_model=BatchOut)
+async def follow_users_batch(batch: FollowBatchIn,
+                             session: AsyncSession = Depends(async_get_db),
+                             current_user: CurrentUser = Depends(get_current_user)):
+    """Эндпойнт, который позволяет подписаться сразу на нескольких пользователей"""
+
+    user_ids = unique_ids(batch.user_ids)
+    res_follow = await session.execute(follow_statement(current_user.id, user_ids))
+    rows = res_follow.all()
+    followed = [row.id for row in rows if row.changed]
+    if followed:
+        await backfill_from_authors(session, current_user.id, followed)
+        await bump_versions(session, [user_key(current_user.id), *map(user_key, followed)])
+    await session.commit()
+    if followed:
+        suggestion_cache.invalidate(current_user.id)
+
+    items = batch_items(user_ids, {row.id for row in rows}, set(), "User not found")
+    return ORJSONResponse({"result": True, "items": items})
+
+
+@app_api.delete("/users/follow", response_model=BatchOut)
+async def unfollow_users_batch(batch: FollowBatchIn,
+                               session: AsyncSession = Depends(async_get_db),
+                               current_user: CurrentUser = Depends(get_current_user)):
+    """Эндпойнт, который позволяет отписаться сразу от нескольких пользователей"""
+
+    user_ids = unique_ids(batch.user_ids)
+    res_unfollow = await session.execute(unfollow_statement(current_user.id, user_ids))
+    rows = res_unfollow.all()
+    unfollowed = [row.id for row in rows if row.changed]
+    if unfollowed:
+        await remove_authors_from_timeline(session, current_user.id, unfollowed)
+        await bump_versions(session, [user_key(current_user.id), *map(user_key, unfollowed)])
     await session.commit()
+    if unfollowed:
+        suggestion_cache.invalidate(current_user.id)
 
-    return {"result": True}
+    items = batch_items(user_ids, {row.id for row in rows}, set(), "User not found")
+    return ORJSONResponse({"result": True, "items": items})
 
 
-@app_api.post("/users/{user_id}/follow")
+@app_api.post("/users/{user_id}/follow", status_code=201, response_model=ResultOut,
+              responses={404: {"model": ErrorOut}})
 async def follow_user(user_id: int,
                      session: AsyncSession = Depends(async_get_db),
-                     api_key: str = Header(None)):
+                     current_user: CurrentUser = Depends(get_current_user)):
     """Эндпойнт, который позволяет пользователю зафоловить другого пользователя"""
 
-    res_curr_user = await session.execute(select(User).filter(
-        User.api_key == api_key).options(
-            selectinload(User.following),
-                    selectinload(User.subscribers)
-        )
+    res_follow = await session.execute(
+        pg_insert(association_table).from_select(
+            ["subscriber_id", "following_id"],
+            select(literal(current_user.id), User.id).where(User.id == user_id),
+        ).on_conflict_do_nothing()
     )
-    current_user = res_curr_user.scalar()
-
-    res_follow_user = await session.execute(select(User).filter(
-        User.id == user_id).options(
-            selectinload(User.following),
-                    selectinload(User.subscribers)
-        )
-    )
-    following_user = res_follow_user.scalar()
+    if res_follow.rowcount == 0 and not await session.scalar(select(User.id).where(User.id == user_id)):
+        response = {
+            "result": False,
+            "error_type": "NotFound",
+            "error_message": "User not found"
+        }
+        return ORJSONResponse(response, status_code=404)
 
-    current_user.following.append(following_user)
+    if res_follow.rowcount:
+        await backfill_from_author(session, current_user.id, user_id)
+        await bump_versions(session, [user_key(current_user.id), user_key(user_id)])
     await session.commit()
+    if res_follow.rowcount:
+        suggestion_cache.invalidate(current_user.id)
 
     response = {"result": True}
-    return JSONResponse(content=jsonable_encoder(response), status_code=201)
+    return ORJSONResponse(response, status_code=201)
 
 
-@app_api.delete("/users/{user_id}/follow")
+@app_api.delete("/users/{user_id}/follow", response_model=ResultOut)
 async def unsubscribe_from_user(user_id: int,
                      session: AsyncSession = Depends(async_get_db),
-                     api_key: str = Header(None)):
+                     current_user: CurrentUser = Depends(get_current_user)):
     """Эндпойнт, который позволяет пользователю убрать подписку на другого пользователя"""
 
-    res_curr_user = await session.execute(select(User).filter(
-        User.api_key == api_key).options(
-            selectinload(User.following),
-                    selectinload(User.subscribers)
-        )
-    )
-    current_user = res_curr_user.scalar()
-
-    res_follow_user = await session.execute(select(User).filter(
-        User.id == user_id).options(
-            selectinload(User.following),
-                    selectinload(User.subscribers)
-        )
-    )
-    following_user = res_follow_user.scalar()
-
-    current_user.following.remove(following_user)
+    res_unfollow = await session.execute(delete(association_table).where(
+        association_table.c.subscriber_id == current_user.id,
+        association_table.c.following_id == user_id,
+    ))
+    if res_unfollow.rowcount:
+        await remove_author_from_timeline(session, current_user.id, user_id)
+        await bump_versions(session, [user_key(current_user.id), user_key(user_id)])
     await session.commit()
+    if res_unfollow.rowcount:
+        suggestion_cache.invalidate(current_user.id)
 
-    return {"result": True}
+    return ORJSONResponse({"result": True})
 
 
-@app_api.get("/tweets")
-async def get_tweets_list(session: AsyncSession = Depends(async_get_db),
+@app_api.get("/tweets", response_model=FeedOut, responses={400: {"model": ErrorOut}})
+async def get_tweets_list(request: Request,
+                          cursor: Optional[str] = None,
+                          limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+                          feed: str = Query("global", regex="^(global|home)$"),
+                          with_likes: bool = True,
+                          likes_limit: Optional[int] = Query(None, ge=1, le=FEED_LIKES_MAX_LIMIT),
+                          session: AsyncSession = Depends(async_get_read_db),
                           api_key: str = Header(None)):
-    """Эндпойнт получения ленты с твитами"""
-
-    res_tweets = await session.execute(select(Tweet))
-    tweets = res_tweets.scalars().all()
-    tweets_data = []
-
-    for tweet in tweets:
-        attachments = [image.url for image in tweet.image]
-        likes = [{"user_id": like.user.id, "name": like.user.name} for like in tweet.likes]
-        tweet_info = {
-            "id": tweet.id,
-            "content": tweet.content,
-            "attachments": attachments,
-            "author": {"id": tweet.author.id, "name": tweet.author.name},
-            "likes": likes,
+    """
+    Эндпойнт получения ленты с твитами (постранично, от новых к старым).
+    feed=home возвращает домашнюю ленту: свои твиты и твиты подписок.
+    likes_limit=N отдает у твита только первых N лайкнувших (полное число - в like_count);
+    with_likes=false отдает только счетчик лайков без списка лайкнувших.
+    Поддерживает If-None-Match: неизменившаяся лента отдается ответом 304 без чтения твитов.
+    """
+
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        response = {
+            "result": False,
+            "error_type": "ValueError",
+            "error_message": str(exc)
+        }
+        return ORJSONResponse(response, status_code=400)
+
+    tweet_ids = None
+    if feed == "home":
+        current_user = await get_current_user(session, api_key)
+        tweet_ids = home_timeline_ids(current_user.id, limit, position)
+        etag = await current_etag(session, [FEED_KEY, user_key(current_user.id)], scope=str(current_user.id))
+        headers = etag_headers(etag, vary="Api-Key")
+    else:
+        headers = etag_headers(await current_etag(session, [FEED_KEY]))
+    unchanged = not_modified(request, headers)
+    if unchanged is not None:
+        return unchanged
+
+    res_tweets = await session.execute(feed_page_query(limit, position, tweet_ids, with_likes, likes_limit))
+    tweets_data, next_cursor = build_feed_page(res_tweets.all(), limit)
+    return ORJSONResponse({"result": True, "tweets": tweets_data, "next_cursor": next_cursor}, headers=headers)
+
+
+@app_api.get("/tweets/trending", response_model=TrendingOut)
+async def get_trending_tweets(limit: int = Query(FEED_PAGE_SIZE, ge=1, le=TRENDING_MAX_SIZE),
+                              with_likes: bool = True,
+                              likes_limit: Optional[int] = Query(None, ge=1, le=FEED_LIKES_MAX_LIMIT),
+                              session: AsyncSession = Depends(async_get_read_db)):
+    """
+    Эндпойнт популярных твитов: top-K по лайкам с затуханием во времени.
+    score - сумма весов лайков, свежий лайк весит 1, вес убывает вдвое каждые TRENDING_HALF_LIFE_HOURS.
+    """
+
+    res_tweets = await session.execute(trending_page_query(limit, with_likes, likes_limit))
+    tweets_data = [
+        {**tweet_from_row(row), "score": current_score(row.log_score)}
+        for row in res_tweets
+    ]
+    return ORJSONResponse({"result": True, "tweets": tweets_data})
+
+
+@app_api.get("/tweets/search", response_model=FeedOut, responses={400: {"model": ErrorOut}})
+async def search_tweets(q: str = Query(..., min_length=1, max_length=SEARCH_MAX_LENGTH),
+                        cursor: Optional[str] = None,
+                        limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+                        order: str = Query("rank", regex="^(rank|recent)$"),
+                        with_likes: bool = True,
+                        likes_limit: Optional[int] = Query(None, ge=1, le=FEED_LIKES_MAX_LIMIT),
+                        session: AsyncSession = Depends(async_get_read_db)):
+    """
+    Эндпойнт поиска твитов по тексту (постранично).
+    order=rank - по релевантности, order=recent - от новых к старым.
+    Слова запроса ищутся по префиксу; запросы короче 3 символов - подстрокой, от новых к старым.
+    """
+
+    order = search_order(q, order)
+    try:
+        position = decode_search_cursor(cursor, order) if cursor else None
+    except ValueError as exc:
+        response = {
+            "result": False,
+            "error_type": "ValueError",
+            "error_message": str(exc)
+        }
+        return ORJSONResponse(response, status_code=400)
+
+    res_tweets = await session.execute(search_page_query(q, limit, order, position, with_likes, likes_limit))
+    tweets_data, next_cursor = build_search_page(res_tweets.all(), limit, order)
+    return ORJSONResponse({"result": True, "tweets": tweets_data, "next_cursor": next_cursor})
+
+
+@app_api.get("/users", response_model=UsersOut, responses={400: {"model": ErrorOut}, 422: {"model": ErrorOut}})
+async def get_users_by_ids(ids: str = Query(..., regex=r"^\d+(,\d+)*$"),
+                           session: AsyncSession = Depends(async_get_read_db)):
+    """Эндпойнт получения нескольких пользователей по списку id через запятую: /users?ids=1,2,3"""
+
+    user_ids = unique_ids(int(user_id) for user_id in ids.split(","))
+    if not all(0 < user_id <= MAX_ID for user_id in user_ids):
+        response = {
+            "result": False,
+            "error_type": "ValueError",
+            "error_message": f"User ids must be between 1 and {MAX_ID}"
         }
-        tweets_data.append(tweet_info)
-    return {"result": True, "tweets": tweets_data}
+        return ORJSONResponse(response, status_code=422)
+    if len(user_ids) > BATCH_MAX_SIZE:
+        response = {
+            "result": False,
+            "error_type": "ValueError",
+            "error_message": f"No more than {BATCH_MAX_SIZE} ids per request"
+        }
+        return ORJSONResponse(response, status_code=400)
 
+    res_users = await session.execute(select(User.id, User.name).where(User.id.in_(user_ids)))
+    users = {row.id: {"id": row.id, "name": row.name} for row in res_users}
+    return ORJSONResponse({
+        "result": True,
+        "users": [users[user_id] for user_id in user_ids if user_id in users],
+        "not_found": [user_id for user_id in user_ids if user_id not in users],
+    })
 
-@app_api.get("/users/me")
-async def get_current_user_info(session: AsyncSession = Depends(async_get_db),
+
+@app_api.get("/users/me", response_model=UserOut)
+async def get_current_user_info(request: Request,
+                                read_session: AsyncSession = Depends(async_get_read_db),
+                                session: AsyncSession = Depends(async_get_db),
                                 api_key: str = Header(None)):
-    """Эндпойнт получения информации о своём профиле + создание нового пользователя"""
+    """
+    Эндпойнт получения информации о своём профиле + создание нового пользователя.
+    Поддерживает If-None-Match: неизменившийся профиль отдается ответом 304.
+    """
 
     if not api_key:
-        response = jsonable_encoder({"message": "Please, provide http-header 'Api-key' in your request"})
-        return JSONResponse(content=response, status_code=400)
+        response = {"message": "Please, provide http-header 'Api-key' in your request"}
+        return ORJSONResponse(response, status_code=400)
     else:
-        res = await session.execute(select(User).where(
-            User.api_key == api_key).options(
-            selectinload(User.following),
-                    selectinload(User.subscribers))
-        )
-        user = res.scalar()
+        user = await resolve_api_key(read_session, api_key)
 
         if not user:
-            user = User(name=random.choice(NAMES), api_key=api_key)
-            session.add(user)
+            res_new = await session.execute(
+                pg_insert(User)
+                .values(name=random.choice(NAMES), api_key=api_key)
+                .on_conflict_do_nothing(index_elements=["api_key"])
+                .returning(User.id, User.name)
+            )
+            created = res_new.first()
             await session.commit()
 
-            return {
+            if created is None:
+                # Пользователь уже есть в основной базе, но еще не попал на реплику
+                user = await resolve_api_key(session, api_key)
+                read_session = session
+
+        if not user:
+            user = CurrentUser(*created)
+            user_cache.put(api_key, user)
+
+            return ORJSONResponse({
                 "result": True,
                 "user": {
                     "id": user.id,
                     "name": user.name,
                     "followers": [],
                     "following": [],
+                    "followers_count": 0,
+                    "following_count": 0,
+                    "followers_next_cursor": None,
+                    "following_next_cursor": None,
                 },
-            }
+            })
 
-        followers = [{"id": follower.id, "name": follower.name} for follower in user.subscribers]
-        following = [{"id": following.id, "name": following.name} for following in user.following]
+        etag = await current_etag(read_session, [user_key(user.id)], scope=str(user.id))
+        headers = etag_headers(etag, vary="Api-Key")
+        unchanged = not_modified(request, headers)
+        if unchanged is not None:
+            return unchanged
 
-        return {
+        return ORJSONResponse({
             "result": True,
             "user": {
                 "id": user.id,
                 "name": user.name,
-                "followers": followers,
-                "following": following,
+                **await get_user_connections(read_session, user.id),
             },
-        }
+        }, headers=headers)
 
 
-@app_api.get("/users/{user_id}")
-async def get_user_info_by_id(user_id: int, session: AsyncSession = Depends(async_get_db)):
-    """Эндпойнт получения информации о произвольном профиле по его id"""
-
-    res = await session.execute(select(User).where(
-        User.id == user_id).options(
-        selectinload(User.following),
-        selectinload(User.subscribers))
-    )
-    user = res.scalar()
+@app_api.get("/users/me/suggestions", response_model=SuggestionsOut)
+async def get_follow_suggestions(limit: int = Query(10, ge=1, le=SUGGESTIONS_MAX_SIZE),
+                                 session: AsyncSession = Depends(async_get_db),
+                                 current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Эндпойнт рекомендаций «кого читать»: пользователи, на которых подписаны мои подписки.
+    Чем больше моих подписок читают пользователя, тем выше он в списке.
+    Читается из основной базы: после подписки кэш сбрасывается и не должен заполниться данными отстающей реплики.
+    """
+
+    suggestions = await get_suggestions(session, current_user.id)
+    return ORJSONResponse({"result": True, "users": suggestions[:limit]})
+
+
+@app_api.get("/users/{user_id}", response_model=UserOut, responses={404: {"model": ErrorOut}})
+async def get_user_info_by_id(user_id: int, request: Request,
+                              session: AsyncSession = Depends(async_get_read_db)):
+    """
+    Эндпойнт получения информации о произвольном профиле по его id.
+    Поддерживает If-None-Match: неизменившийся профиль отдается ответом 304 без чтения пользователей.
+    """
+
+    headers = etag_headers(await current_etag(session, [user_key(user_id)]))
+    unchanged = not_modified(request, headers)
+    if unchanged is not None:
+        return unchanged
+
+    res = await session.execute(select(User.id, User.name).where(User.id == user_id))
+    user = res.first()
     if not user:
         response = {
             "result": False,
             "error_type": "NotFound",
             "error_message": "User not found"
         }
-        return JSONResponse(content=jsonable_encoder(response), status_code=404)
+        return ORJSONResponse(response, status_code=404)
 
-    followers = [{"id": follower.id, "name": follower.name} for follower in user.subscribers]
-    following = [{"id": following.id, "name": following.name} for following in user.following]
-    return {
+    return ORJSONResponse({
         "result": True,
         "user": {
             "id": user.id,
             "name": user.name,
-            "followers": followers,
-            "following": following,
+            **await get_user_connections(session, user.id),
         },
-    }
+    }, headers=headers)
+
+
+async def get_connections_page(request: Request, session: AsyncSession, user_id: int, direction: str,
+                               cursor: Optional[str], limit: int) -> Response:
+    """Страница подписчиков или подписок пользователя с поддержкой If-None-Match"""
+
+    try:
+        after = decode_user_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        response = {
+            "result": False,
+            "error_type": "ValueError",
+            "error_message": str(exc)
+        }
+        return ORJSONResponse(response, status_code=400)
+
+    headers = etag_headers(await current_etag(session, [user_key(user_id)]))
+    unchanged = not_modified(request, headers)
+    if unchanged is not None:
+        return unchanged
+
+    res_users = await session.execute(connections_page_query(user_id, direction, limit, after))
+    rows = res_users.all()
+    if not rows and after is None and not await session.scalar(select(User.id).where(User.id == user_id)):
+        response = {
+            "result": False,
+            "error_type": "NotFound",
+            "error_message": "User not found"
+        }
+        return ORJSONResponse(response, status_code=404)
+
+    users, next_cursor = build_connections_page(rows, limit)
+    return ORJSONResponse({"result": True, "users": users, "next_cursor": next_cursor}, headers=headers)
+
+
+@app_api.get("/users/{user_id}/followers", response_model=ConnectionsOut,
+             responses={400: {"model": ErrorOut}, 404: {"model": ErrorOut}})
+async def get_user_followers(user_id: int, request: Request,
+                             cursor: Optional[str] = None,
+                             limit: int = Query(CONNECTIONS_PAGE_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+                             session: AsyncSession = Depends(async_get_read_db)):
+    """Эндпойнт получения подписчиков пользователя (постранично, по возрастанию id)"""
+    return await get_connections_page(request, session, user_id, FOLLOWERS, cursor, limit)
+
+
+@app_api.get("/users/{user_id}/following", response_model=ConnectionsOut,
+             responses={400: {"model": ErrorOut}, 404: {"model": ErrorOut}})
+async def get_user_following(user_id: int, request: Request,
+                             cursor: Optional[str] = None,
+                             limit: int = Query(CONNECTIONS_PAGE_SIZE, ge=1, le=CONNECTIONS_MAX_PAGE_SIZE),
+                             session: AsyncSession = Depends(async_get_read_db)):
+    """Эндпойнт получения подписок пользователя (постранично, по возрастанию id)"""
+    return await get_connections_page(request, session, user_id, FOLLOWING, cursor, limit)
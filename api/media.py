@@ -0,0 +1,181 @@
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from fastapi import Request, UploadFile
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from database import config
+from http_cache import (
+    IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, FileRangeResponse, RangeNotSatisfiable,
+    http_date, is_not_modified, not_modified_response, parse_range,
+)
+
+OUT_PATH = Path(__file__).parent / 'images'
+# Картинки отдаются эндпойнтом /api/images/{file_name} приложения app_api,
+# смонтированного в /api
+MEDIA_URL_PREFIX = "api/api/images"
+
+MEDIA_MAX_SIZE = int(config.get("MEDIA_MAX_SIZE", 10 * 1024 * 1024))
+MEDIA_ALLOWED_TYPES = frozenset(
+    config.get("MEDIA_ALLOWED_TYPES", "image/jpeg,image/png,image/gif,image/webp").split(",")
+)
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+# Сигнатуры начала файла для определения типа по содержимому
+SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"GIF87a", "image/gif", ".gif"),
+    (b"GIF89a", "image/gif", ".gif"),
+)
+
+# Имя файла, сохраненного под sha256 содержимого (или его уменьшенной копии)
+CONTENT_ADDRESSED_NAME = re.compile(r"^([0-9a-f]{64}(?:-[a-z]+)?)\.[a-z0-9]+$")
+
+
+class MediaError(Exception):
+    """Загруженный файл не прошел проверку размера или типа"""
+
+    def __init__(self, message: str, error_type: str, status_code: int):
+        super().__init__(message)
+        self.error_type = error_type
+        self.status_code = status_code
+
+
+class StoredMedia(NamedTuple):
+    content_hash: str
+    content_type: str
+    size: int
+    file_name: str
+
+    @property
+    def url(self) -> str:
+        return f"{MEDIA_URL_PREFIX}/{self.file_name}"
+
+    @property
+    def path(self) -> Path:
+        return OUT_PATH / self.file_name
+
+
+def detect_content_type(head: bytes) -> Optional[tuple]:
+    """Тип и расширение файла по первым байтам содержимого"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    for signature, content_type, extension in SIGNATURES:
+        if head.startswith(signature):
+            return content_type, extension
+    return None
+
+
+def _write_chunk(file, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    file.write(chunk)
+
+
+def _publish(tmp_path: Path, final_path: Path) -> None:
+    """
+    Перенос временного файла на место; одинаковое содержимое хранится один раз.
+    Повторная загрузка обновляет время изменения файла: MediaReaper не удаляет
+    файлы, измененные в пределах грейс-периода.
+    """
+    if final_path.exists():
+        tmp_path.unlink()
+        os.utime(final_path)
+    else:
+        os.replace(tmp_path, final_path)
+
+
+async def store_upload(upload: UploadFile) -> StoredMedia:
+    """
+    Потоковая запись загрузки на диск под именем по sha256 содержимого.
+
+    Чтение, хеширование и запись блоков выполняются в пуле потоков,
+    event loop не блокируется даже на больших файлах.
+    """
+    await run_in_threadpool(os.makedirs, OUT_PATH, exist_ok=True)
+
+    head = await upload.read(MEDIA_CHUNK_SIZE)
+    detected = detect_content_type(head)
+    if detected is None or detected[0] not in MEDIA_ALLOWED_TYPES:
+        raise MediaError("Unsupported media type", "UnsupportedMediaType", 415)
+    content_type, extension = detected
+
+    hasher = hashlib.sha256()
+    tmp_path = OUT_PATH / f".upload-{uuid.uuid4().hex}"
+    size = 0
+    file = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            if size > MEDIA_MAX_SIZE:
+                raise MediaError(f"File is larger than {MEDIA_MAX_SIZE} bytes", "PayloadTooLarge", 413)
+            await run_in_threadpool(_write_chunk, file, hasher, chunk)
+            chunk = await upload.read(MEDIA_CHUNK_SIZE)
+    except BaseException:
+        await run_in_threadpool(file.close)
+        await run_in_threadpool(tmp_path.unlink, True)
+        raise
+    await run_in_threadpool(file.close)
+
+    content_hash = hasher.hexdigest()
+    file_name = f"{content_hash}{extension}"
+    await run_in_threadpool(_publish, tmp_path, OUT_PATH / file_name)
+    return StoredMedia(content_hash, content_type, size, file_name)
+
+
+async def media_response(request: Request, file_name: str) -> Response:
+    """
+    Отдача сохраненной картинки с поддержкой HTTP-кэширования.
+
+    Файлы с именем по хешу содержимого неизменяемы: их ETag - сам хеш,
+    а Cache-Control разрешает кэшировать их без перепроверки.
+    Поддерживаются условные запросы (304) и одиночный Range (206).
+    """
+    file_name = Path(file_name).name
+    path = OUT_PATH / file_name
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        response = {
+            "result": False,
+            "error_type": "NotFound",
+            "error_message": "Image not found"
+        }
+        return ORJSONResponse(response, status_code=404)
+
+    content_addressed = CONTENT_ADDRESSED_NAME.match(file_name)
+    if content_addressed:
+        etag = f'"{content_addressed.group(1)}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        cache_control = REVALIDATE_CACHE_CONTROL
+
+    headers = {
+        "etag": etag,
+        "last-modified": http_date(stat_result.st_mtime),
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+    }
+    if is_not_modified(request.headers, etag, stat_result.st_mtime):
+        return not_modified_response(headers)
+
+    media_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    size = stat_result.st_size
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag or if_range == headers["last-modified"]:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        if byte_range is not None:
+            return FileRangeResponse(path, *byte_range, size, headers=headers, media_type=media_type)
+
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import Delete, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from database import async_session, config
+from media import OUT_PATH
+from models import Image
+
+logger = logging.getLogger(__name__)
+
+# Картинки без твита удаляются не раньше, чем через столько часов после загрузки:
+# за это время клиент успевает опубликовать твит с загруженной картинкой
+MEDIA_GC_GRACE_HOURS = float(config.get("MEDIA_GC_GRACE_HOURS", 24))
+# Сколько записей images удаляется одной транзакцией
+MEDIA_GC_BATCH_SIZE = int(config.get("MEDIA_GC_BATCH_SIZE", 500))
+# Период запуска сборщика, сек.
+MEDIA_GC_INTERVAL_SECONDS = float(config.get("MEDIA_GC_INTERVAL_SECONDS", 600))
+# Ключ pg_try_advisory_xact_lock: сборку выполняет один воркер
+REAPER_LOCK_KEY = 7_301_023
+
+
+class OrphanBatch(NamedTuple):
+    deleted: int
+    files: List[Path]
+
+
+def orphaned_media_statement(grace_hours: float, batch_size: int) -> Delete:
+    """
+    Удаление пачки самых старых картинок без твита (по частичному индексу
+    ix_images_orphaned). Строки, которые в этот момент привязывают к
+    твиту, пропускаются (SKIP LOCKED).
+    """
+    orphaned = (
+        select(Image.id)
+        .where(Image.tweet_id.is_(None), Image.created_at < func.now() - timedelta(hours=grace_hours))
+        .order_by(Image.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        delete(Image)
+        .where(Image.id.in_(orphaned.scalar_subquery()))
+        .returning(Image.content_hash, Image.url, Image.thumbnail_url, Image.feed_url, Image.webp_url)
+    )
+
+
+async def reap_orphaned_media(session: AsyncSession, grace_hours: float = MEDIA_GC_GRACE_HOURS,
+                              batch_size: int = MEDIA_GC_BATCH_SIZE) -> Optional[OrphanBatch]:
+    """
+    Удаление пачки записей images без твита в текущей транзакции.
+
+    Возвращает число удаленных записей и файлы, на которые больше не
+    ссылается ни одна запись: одинаковые загрузки хранятся одним файлом,
+    поэтому файл удаляется только вместе с последней записью с тем же
+    content_hash (или url для записей без хеша). Файлы удаляются после
+    фиксации транзакции. Если сборка уже идет в другом воркере,
+    возвращает None.
+    """
+    locked = await session.scalar(select(func.pg_try_advisory_xact_lock(REAPER_LOCK_KEY)))
+    if not locked:
+        return None
+
+    res_deleted = await session.execute(orphaned_media_statement(grace_hours, batch_size))
+    rows = res_deleted.all()
+    if not rows:
+        return OrphanBatch(0, [])
+
+    hashes = {row.content_hash for row in rows if row.content_hash}
+    urls = {row.url for row in rows if not row.content_hash}
+    referenced_hashes = set(await session.scalars(
+        select(Image.content_hash).where(Image.content_hash.in_(hashes)).distinct()
+    )) if hashes else set()
+    referenced_urls = set(await session.scalars(
+        select(Image.url).where(Image.url.in_(urls)).distinct()
+    )) if urls else set()
+
+    files = set()
+    for row in rows:
+        if row.content_hash in referenced_hashes or row.url in referenced_urls:
+            continue
+        for url in (row.url, row.thumbnail_url, row.feed_url, row.webp_url):
+            if url:
+                files.add(OUT_PATH / Path(url).name)
+    return OrphanBatch(len(rows), sorted(files))
+
+
+def remove_files(files: Iterable[Path], modified_before: float) -> int:
+    """
+    Удаление файлов картинок. Файл, измененный после modified_before,
+    пропускается: его только что загрузили повторно (store_upload
+    обновляет время изменения существующего файла).
+    """
+    removed = 0
+    for path in files:
+        try:
+            if path.stat().st_mtime >= modified_before:
+                continue
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+class MediaReaper:
+    """Фоновое удаление картинок без твита и их файлов раз в MEDIA_GC_INTERVAL_SECONDS"""
+
+    def __init__(self, session_factory: async_sessionmaker = async_session,
+                 interval: float = MEDIA_GC_INTERVAL_SECONDS, grace_hours: float = MEDIA_GC_GRACE_HOURS,
+                 batch_size: int = MEDIA_GC_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.grace_hours = grace_hours
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def reap(self) -> int:
+        """Удаление всех просроченных картинок пачками; возвращает число удаленных файлов"""
+        removed = 0
+        while True:
+            modified_before = time.time() - self.grace_hours * 3600
+            async with self.session_factory() as session:
+                batch = await reap_orphaned_media(session, self.grace_hours, self.batch_size)
+                if batch is None:
+                    return removed
+                await session.commit()
+            if batch.files:
+                removed += await run_in_threadpool(remove_files, batch.files, modified_before)
+            if batch.deleted < self.batch_size:
+                return removed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                removed = await self.reap()
+                if removed:
+                    logger.info("Removed %d orphaned media files", removed)
+            except Exception:
+                logger.exception("Failed to remove orphaned media")
+            await asyncio.sleep(self.interval)
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+media_reaper = MediaReaper()
@@ -0,0 +1,153 @@
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+registry = CollectorRegistry()
+# При нескольких воркерах (server.py) значения метрик пишутся в файлы этого каталога,
+# и /metrics отдает сумму по всем воркерам, а не по ответившему процессу
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+# Метрики кэшей для режима нескольких воркеров: (метрика, кэш, ключ stats())
+_cache_gauges: List[Tuple[Gauge, object, str]] = []
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Время обработки запроса", ["route"], registry=registry,
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request", "Число SQL-запросов за один HTTP-запрос", ["route"], registry=registry,
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55, float("inf")),
+)
+DB_TIME = Histogram(
+    "db_time_seconds_per_request", "Суммарное время SQL-запросов за один HTTP-запрос", ["route"],
+    registry=registry,
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds_per_request", "Ожидание соединения из пула за один HTTP-запрос", ["route"],
+    registry=registry, buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf")),
+)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_time: float = 0.0
+    pool_wait: float = 0.0
+
+
+# Статистика текущего запроса; контекст наследуется гринлетами SQLAlchemy
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, учитывающий время ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = request_stats.get()
+            if stats is not None:
+                stats.pool_wait += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info["query_started"].pop()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    """Подключение учета SQL-запросов к движку"""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: метрики запроса с меткой шаблона маршрута"""
+
+    def __init__(self, app: ASGIApp, routes: Sequence = ()):
+        self.app = app
+        self.routes = routes
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_label(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._route_paths:
+            for route in self.routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    self._route_paths[endpoint] = route.path
+                    break
+            else:
+                self._route_paths[endpoint] = getattr(endpoint, "__name__", "unknown")
+        return f"{scope['method']} {self._route_paths[endpoint]}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_stats.reset(token)
+            route = self._route_label(scope)
+            REQUEST_DURATION.labels(route).observe(time.perf_counter() - started)
+            DB_QUERIES.labels(route).observe(stats.queries)
+            DB_TIME.labels(route).observe(stats.db_time)
+            DB_POOL_WAIT.labels(route).observe(stats.pool_wait)
+            refresh_cache_gauges()
+
+
+def register_cache_gauges(name: str, cache) -> None:
+    """
+    Размер и попадания in-process кэша с методом stats(). При нескольких
+    воркерах значения суммируются по живым процессам; каждый воркер
+    обновляет свои значения после каждого запроса.
+    """
+    for key in ("size", "hits", "misses"):
+        gauge = Gauge(f"{name}_cache_{key}", f"{name} cache {key}", registry=registry, multiprocess_mode="livesum")
+        if MULTIPROCESS:
+            _cache_gauges.append((gauge, cache, key))
+        else:
+            gauge.set_function(lambda key=key: cache.stats()[key])
+
+
+def refresh_cache_gauges() -> None:
+    for gauge, cache, key in _cache_gauges:
+        gauge.set(cache.stats()[key])
+
+
+def mark_worker_stopped() -> None:
+    """Удаление значений остановленного воркера из суммы livesum"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        refresh_cache_gauges()
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return Response(generate_latest(collected), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,61 @@
+"""Initial schema
+
+Схема, которую раньше создавал Base.metadata.create_all при старте.
+Для базы, созданной таким образом, выполните alembic stamp 0001.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("api_key", sa.String(), nullable=False, unique=True),
+    )
+    op.create_table(
+        "association_table",
+        sa.Column("subscriber_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("following_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+    )
+    op.create_table(
+        "tweets",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+    )
+    op.create_table(
+        "likes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), sa.ForeignKey("tweets.id"), nullable=False),
+    )
+    op.create_table(
+        "images",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), sa.ForeignKey("tweets.id"), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("images")
+    op.drop_table("likes")
+    op.drop_table("tweets")
+    op.drop_table("association_table")
+    op.drop_table("users")
@@ -0,0 +1,75 @@
+"""Feed indexes, like counters, timelines and media metadata
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("tweets", sa.Column("fanout_on_read", sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column("tweets", sa.Column("like_count", sa.Integer(), nullable=False, server_default="0"))
+    op.alter_column("tweets", "fanout_on_read", server_default=None)
+
+    op.add_column("images", sa.Column("content_hash", sa.String(64), nullable=True))
+    op.add_column("images", sa.Column("content_type", sa.String(), nullable=True))
+    op.add_column("images", sa.Column("size", sa.Integer(), nullable=True))
+    op.add_column("images", sa.Column("thumbnail_url", sa.String(), nullable=True))
+    op.add_column("images", sa.Column("feed_url", sa.String(), nullable=True))
+    op.add_column("images", sa.Column("webp_url", sa.String(), nullable=True))
+
+    op.create_table(
+        "timelines",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("tweet_id", sa.Integer(), sa.ForeignKey("tweets.id"), primary_key=True),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+
+    # До уникального ограничения лайки могли дублироваться
+    op.execute(
+        "DELETE FROM likes a USING likes b "
+        "WHERE a.user_id = b.user_id AND a.tweet_id = b.tweet_id AND a.id > b.id"
+    )
+    op.create_unique_constraint("uq_likes_user_id_tweet_id", "likes", ["user_id", "tweet_id"])
+    op.execute(
+        "UPDATE tweets SET like_count = counts.like_count "
+        "FROM (SELECT tweet_id, count(*) AS like_count FROM likes GROUP BY tweet_id) AS counts "
+        "WHERE tweets.id = counts.tweet_id"
+    )
+
+    op.create_index("ix_association_table_following_id", "association_table", ["following_id", "subscriber_id"])
+    op.create_index("ix_tweets_created_at_id", "tweets", ["created_at", "id"])
+    op.create_index("ix_tweets_user_id_created_at", "tweets", ["user_id", "created_at", "id"])
+    op.create_index("ix_likes_tweet_id", "likes", ["tweet_id", "id"])
+    op.create_index("ix_images_tweet_id", "images", ["tweet_id", "id"])
+    op.create_index("ix_images_content_hash", "images", ["content_hash"])
+    op.create_index("ix_timelines_user_id_created_at", "timelines", ["user_id", "created_at", "tweet_id"])
+    op.create_index("ix_timelines_tweet_id", "timelines", ["tweet_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_timelines_tweet_id", table_name="timelines")
+    op.drop_index("ix_timelines_user_id_created_at", table_name="timelines")
+    op.drop_index("ix_images_content_hash", table_name="images")
+    op.drop_index("ix_images_tweet_id", table_name="images")
+    op.drop_index("ix_likes_tweet_id", table_name="likes")
+    op.drop_index("ix_tweets_user_id_created_at", table_name="tweets")
+    op.drop_index("ix_tweets_created_at_id", table_name="tweets")
+    op.drop_index("ix_association_table_following_id", table_name="association_table")
+    op.drop_constraint("uq_likes_user_id_tweet_id", "likes", type_="unique")
+    op.drop_table("timelines")
+    for column in ("webp_url", "feed_url", "thumbnail_url", "size", "content_type", "content_hash"):
+        op.drop_column("images", column)
+    op.drop_column("tweets", "like_count")
+    op.drop_column("tweets", "fanout_on_read")
@@ -0,0 +1,32 @@
+"""Full-text search vector on tweets
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Добавление вычисляемого столбца переписывает таблицу tweets
+    op.add_column(
+        "tweets",
+        sa.Column("search_vector", postgresql.TSVECTOR(), sa.Computed("to_tsvector('simple', content)", persisted=True)),
+    )
+    op.create_index("ix_tweets_search_vector", "tweets", ["search_vector"], postgresql_using="gin")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_search_vector", table_name="tweets")
+    op.drop_column("tweets", "search_vector")
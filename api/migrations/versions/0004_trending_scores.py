@@ -0,0 +1,39 @@
+"""Like timestamps and trending scores
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 17:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("likes", sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=True))
+    # Время старых лайков неизвестно: берется время твита, чтобы они не попали в популярное
+    op.execute("UPDATE likes SET created_at = tweets.created_at FROM tweets WHERE tweets.id = likes.tweet_id")
+    op.alter_column("likes", "created_at", nullable=False, server_default=sa.func.now())
+    op.create_index("ix_likes_created_at", "likes", ["created_at"])
+
+    op.create_table(
+        "trending",
+        sa.Column("tweet_id", sa.Integer(), sa.ForeignKey("tweets.id"), primary_key=True),
+        sa.Column("log_score", sa.Float(), nullable=False),
+    )
+    op.create_index("ix_trending_log_score", "trending", ["log_score"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_trending_log_score", table_name="trending")
+    op.drop_table("trending")
+    op.drop_index("ix_likes_created_at", table_name="likes")
+    op.drop_column("likes", "created_at")
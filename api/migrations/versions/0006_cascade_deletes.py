@@ -0,0 +1,52 @@
+"""ON DELETE CASCADE for tweet children and orphaned media tracking
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 19:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Таблица, столбец и поведение при удалении твита; имена ограничений - по умолчанию Postgres
+TWEET_FOREIGN_KEYS = (
+    ("likes", "tweet_id", "CASCADE"),
+    ("timelines", "tweet_id", "CASCADE"),
+    ("trending", "tweet_id", "CASCADE"),
+    ("images", "tweet_id", "SET NULL"),
+)
+
+
+def _recreate_foreign_keys(with_ondelete: bool) -> None:
+    for table, column, ondelete in TWEET_FOREIGN_KEYS:
+        name = f"{table}_{column}_fkey"
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(
+            name, table, "tweets", [column], ["id"], ondelete=ondelete if with_ondelete else None
+        )
+
+
+def upgrade() -> None:
+    _recreate_foreign_keys(with_ondelete=True)
+    # Время загрузки старых картинок неизвестно: грейс-период отсчитывается от миграции
+    op.add_column(
+        "images",
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index(
+        "ix_images_orphaned", "images", ["created_at"], postgresql_where=sa.text("tweet_id IS NULL")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_images_orphaned", table_name="images")
+    op.drop_column("images", "created_at")
+    _recreate_foreign_keys(with_ondelete=False)
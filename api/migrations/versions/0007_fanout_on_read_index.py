@@ -0,0 +1,28 @@
+"""Partial index for fan-out-on-read tweets
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_tweets_fanout_on_read", "tweets", ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        postgresql_where=sa.text("fanout_on_read"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_fanout_on_read", table_name="tweets")
@@ -0,0 +1,51 @@
+"""Backfill timelines for existing users
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from timeline import FANOUT_FOLLOWER_LIMIT, TIMELINE_BACKFILL_SIZE
+
+
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Твиты, созданные до 0002, не размечены: авторы с большим числом подписчиков
+    # читаются при чтении ленты и в ленты не копируются
+    op.execute(
+        sa.text(
+            "UPDATE tweets SET fanout_on_read = true WHERE NOT fanout_on_read AND user_id IN ("
+            "SELECT following_id FROM association_table GROUP BY following_id HAVING count(*) > :limit)"
+        ).bindparams(limit=FANOUT_FOLLOWER_LIMIT)
+    )
+    # Последние твиты каждой подписки и собственные твиты пользователя,
+    # как их добавили бы fan_out_tweet и backfill_from_authors
+    op.execute(
+        sa.text(
+            "INSERT INTO timelines (user_id, tweet_id, created_at) "
+            "SELECT a.subscriber_id, t.id, t.created_at FROM association_table a "
+            "CROSS JOIN LATERAL (SELECT id, created_at FROM tweets "
+            "WHERE user_id = a.following_id AND NOT fanout_on_read "
+            "ORDER BY created_at DESC, id DESC LIMIT :depth) AS t "
+            "UNION ALL "
+            "SELECT u.id, t.id, t.created_at FROM users u "
+            "CROSS JOIN LATERAL (SELECT id, created_at FROM tweets "
+            "WHERE user_id = u.id ORDER BY created_at DESC, id DESC LIMIT :depth) AS t "
+            "ON CONFLICT DO NOTHING"
+        ).bindparams(depth=TIMELINE_BACKFILL_SIZE)
+    )
+
+
+def downgrade() -> None:
+    # Записи лент восстанавливаются из твитов и подписок, удалять их незачем
+    pass
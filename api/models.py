@@ -1,7 +1,8 @@
 from database import Base
 from datetime import datetime, timezone
-from typing import List
-from sqlalchemy import Column, ForeignKey, Integer, Table
+from typing import List, Optional
+from sqlalchemy import BigInteger, Column, Computed, ForeignKey, Index, Integer, String, Table, UniqueConstraint, func, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.types import TIMESTAMP
 
@@ -10,6 +11,8 @@ association_table = Table(
     Base.metadata,
     Column("subscriber_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("following_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # Первичный ключ покрывает поиск подписок, этот индекс - поиск подписчиков
+    Index("ix_association_table_following_id", "following_id", "subscriber_id"),
 )
 
 
@@ -27,7 +30,7 @@ class User(Base):
         primaryjoin="User.id==association_table.c.following_id",
         secondaryjoin="User.id==association_table.c.subscriber_id",
         back_populates="following",
-        lazy="selectin"
+        lazy="raise"
     )
 
     # Пользователи, которых читает данный пользователь
@@ -37,14 +40,14 @@ class User(Base):
         primaryjoin="User.id==association_table.c.subscriber_id",
         secondaryjoin="User.id==association_table.c.following_id",
         back_populates="subscribers",
-        lazy="selectin"
+        lazy="raise"
         )
 
     tweets: Mapped[List["Tweet"]] = relationship(
-        back_populates="author", cascade="all, delete-orphan", lazy="selectin"
+        back_populates="author", cascade="all, delete-orphan", lazy="raise"
     )
 
-    likes: Mapped[List["Like"]] = relationship(back_populates="user", cascade="all, delete-orphan", lazy="selectin")
+    likes: Mapped[List["Like"]] = relationship(back_populates="user", cascade="all, delete-orphan", lazy="raise")
 
     def __repr__(self):
         return f"User {self.name}"
@@ -52,15 +55,35 @@ class User(Base):
 
 class Tweet(Base):
     __tablename__ = "tweets"
+    __table_args__ = (
+        Index("ix_tweets_created_at_id", "created_at", "id"),
+        Index("ix_tweets_user_id_created_at", "user_id", "created_at", "id"),
+        # Твиты авторов с рассылкой при чтении: подмешиваются в домашние ленты по автору
+        Index(
+            "ix_tweets_fanout_on_read", "user_id", text("created_at DESC"), text("id DESC"),
+            postgresql_where=text("fanout_on_read"),
+        ),
+        Index("ix_tweets_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     content: Mapped[str] = mapped_column(nullable=False)
-    created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc), type_=TIMESTAMP(timezone=True))
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc), type_=TIMESTAMP(timezone=True))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
-
-    author: Mapped["User"] = relationship(back_populates="tweets", lazy="selectin")
-    likes: Mapped[List["Like"]] = relationship(back_populates="tweet", cascade="all, delete-orphan", lazy="selectin")
-    image: Mapped[List["Image"]] = relationship(back_populates="tweet", cascade="all, delete-orphan", lazy="selectin")
+    # Твит не разослан по лентам подписчиков и подмешивается к ним при чтении
+    fanout_on_read: Mapped[bool] = mapped_column(default=False, nullable=False)
+    # Число лайков, поддерживается вместе со вставкой и удалением строк likes
+    like_count: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    # Поисковый вектор текста, вычисляется базой при вставке и изменении твита
+    search_vector = mapped_column(TSVECTOR, Computed("to_tsvector('simple', content)", persisted=True), deferred=True)
+
+    author: Mapped["User"] = relationship(back_populates="tweets", lazy="raise")
+    # Лайки, записи лент и trending удаляет база (ON DELETE CASCADE) одним DELETE твита,
+    # у картинок tweet_id становится NULL, и их вместе с файлами удаляет MediaReaper
+    likes: Mapped[List["Like"]] = relationship(
+        back_populates="tweet", cascade="all, delete-orphan", passive_deletes=True, lazy="raise"
+    )
+    image: Mapped[List["Image"]] = relationship(back_populates="tweet", passive_deletes=True, lazy="raise")
 
     def __repr__(self):
         return f"<Tweet {self.content[:50]}>"
@@ -68,26 +91,104 @@ class Tweet(Base):
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        UniqueConstraint("user_id", "tweet_id", name="uq_likes_user_id_tweet_id"),
+        Index("ix_likes_tweet_id", "tweet_id", "id"),
+        Index("ix_likes_created_at", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"), nullable=False)
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"), nullable=False)
+    # Время лайка для оценки популярности; ставится базой, одно на весь запрос
+    created_at: Mapped[datetime] = mapped_column(
+        type_=TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
 
-    user: Mapped["User"] = relationship(back_populates="likes", lazy="selectin")
-    tweet: Mapped["Tweet"] = relationship(back_populates="likes", lazy="selectin")
+    user: Mapped["User"] = relationship(back_populates="likes", lazy="raise")
+    tweet: Mapped["Tweet"] = relationship(back_populates="likes", lazy="raise")
 
     def __repr__(self):
-        return f'User {self.user.name} liked tweet "{self.tweet.content[:50]}"'
+        return f"<Like user={self.user_id} tweet={self.tweet_id}>"
 
 
 class Image(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        Index("ix_images_tweet_id", "tweet_id", "id"),
+        # Картинки без твита в порядке загрузки: очередь MediaReaper
+        Index("ix_images_orphaned", "created_at", postgresql_where=text("tweet_id IS NULL")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     url: Mapped[str] = mapped_column(nullable=False)
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"), nullable=True)
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="SET NULL"), nullable=True)
+    # Время загрузки (или повторной загрузки того же файла) для грейс-периода MediaReaper
+    created_at: Mapped[datetime] = mapped_column(
+        type_=TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    # sha256 содержимого: одинаковые загрузки хранятся одним файлом
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), index=True, nullable=True)
+    content_type: Mapped[Optional[str]] = mapped_column(nullable=True)
+    size: Mapped[Optional[int]] = mapped_column(nullable=True)
+    # Уменьшенные копии; NULL, пока фоновое задание их не построило
+    thumbnail_url: Mapped[Optional[str]] = mapped_column(nullable=True)
+    feed_url: Mapped[Optional[str]] = mapped_column(nullable=True)
+    webp_url: Mapped[Optional[str]] = mapped_column(nullable=True)
 
-    tweet: Mapped["Tweet"] = relationship(back_populates="image", lazy="selectin")
+    tweet: Mapped["Tweet"] = relationship(back_populates="image", lazy="raise")
 
     def __repr__(self):
         return f"Image <{self.url}>"
+
+
+class TimelineEntry(Base):
+    """Твит, разосланный в домашнюю ленту пользователя при публикации"""
+    __tablename__ = "timelines"
+    __table_args__ = (
+        Index("ix_timelines_user_id_created_at", "user_id", "created_at", "tweet_id"),
+        Index("ix_timelines_tweet_id", "tweet_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(type_=TIMESTAMP(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"<TimelineEntry user={self.user_id} tweet={self.tweet_id}>"
+
+
+class TrendingScore(Base):
+    """
+    Популярность твита по недавним лайкам с экспоненциальным затуханием.
+
+    log_score = ln(sum(exp((t - TRENDING_EPOCH) / tau))) по лайкам твита:
+    вклад лайка не меняется со временем, а порядок строк по log_score
+    совпадает с порядком по затухшей популярности на любой момент времени.
+    """
+    __tablename__ = "trending"
+    __table_args__ = (
+        Index("ix_trending_log_score", "log_score"),
+    )
+
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
+    log_score: Mapped[float] = mapped_column(nullable=False)
+
+    def __repr__(self):
+        return f"<TrendingScore tweet={self.tweet_id} log_score={self.log_score}>"
+
+
+class ChangeVersion(Base):
+    """
+    Счетчик изменений представления (ленты или профиля) для ETag.
+
+    Увеличивается в той же транзакции, что и изменение данных, поэтому
+    прочитанная до данных версия никогда не опережает сами данные.
+    """
+    __tablename__ = "change_versions"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f"<ChangeVersion {self.key}={self.version}>"
@@ -1,7 +1,123 @@
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, conlist
+
+from batch import BATCH_MAX_SIZE, MAX_ID
+
+ItemId = conint(gt=0, le=MAX_ID)
 
 
 class TweetIn(BaseModel):
     tweet_data: str
     tweet_media_ids: Optional[List[int]] = None
+
+
+class LikesBatchIn(BaseModel):
+    tweet_ids: conlist(ItemId, min_items=1, max_items=BATCH_MAX_SIZE)
+
+
+class FollowBatchIn(BaseModel):
+    user_ids: conlist(ItemId, min_items=1, max_items=BATCH_MAX_SIZE)
+
+
+class MediaAttachIn(BaseModel):
+    media_ids: conlist(ItemId, min_items=1, max_items=BATCH_MAX_SIZE)
+
+
+class ResultOut(BaseModel):
+    result: bool = True
+
+
+class ErrorOut(BaseModel):
+    result: bool = False
+    error_type: str
+    error_message: str
+
+
+class TweetCreatedOut(ResultOut):
+    tweet_id: int
+
+
+class MediaCreatedOut(ResultOut):
+    media_id: int
+
+
+class UserShortOut(BaseModel):
+    id: int
+    name: str
+
+
+class LikeOut(BaseModel):
+    user_id: int
+    name: str
+
+
+class MediaOut(BaseModel):
+    url: str
+    thumbnail: str
+    feed: str
+    webp: str
+
+
+class TweetOut(BaseModel):
+    id: int
+    content: str
+    attachments: List[str]
+    media: List[MediaOut]
+    author: UserShortOut
+    like_count: int
+    likes: Optional[List[LikeOut]] = None
+
+
+class FeedOut(ResultOut):
+    tweets: List[TweetOut]
+    next_cursor: Optional[str] = None
+
+
+class TrendingTweetOut(TweetOut):
+    score: float
+
+
+class TrendingOut(ResultOut):
+    tweets: List[TrendingTweetOut]
+
+
+class UserProfileOut(UserShortOut):
+    followers: List[UserShortOut]
+    following: List[UserShortOut]
+    followers_count: int
+    following_count: int
+    followers_next_cursor: Optional[str] = None
+    following_next_cursor: Optional[str] = None
+
+
+class UserOut(ResultOut):
+    user: UserProfileOut
+
+
+class ConnectionsOut(ResultOut):
+    users: List[UserShortOut]
+    next_cursor: Optional[str] = None
+
+
+class UsersOut(ResultOut):
+    users: List[UserShortOut]
+    not_found: List[int]
+
+
+class SuggestedUserOut(UserShortOut):
+    mutual_count: int
+
+
+class SuggestionsOut(ResultOut):
+    users: List[SuggestedUserOut]
+
+
+class BatchItemOut(BaseModel):
+    id: int
+    result: bool
+    error_type: Optional[str] = None
+    error_message: Optional[str] = None
+
+
+class BatchOut(ResultOut):
+    items: List[BatchItemOut]
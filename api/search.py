@@ -0,0 +1,98 @@
+import base64
+import binascii
+import re
+from typing import Optional, Tuple, Union
+
+from sqlalchemy import Select, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+
+from feed import Cursor, decode_cursor, encode_cursor, tweet_columns, tweet_from_row
+from models import Tweet, User
+
+# Конфигурация полнотекстового поиска; должна совпадать с выражением Tweet.search_vector
+SEARCH_CONFIG = "simple"
+# Более короткие запросы ищутся подстрокой (ILIKE) по ленте от новых к старым
+SEARCH_MIN_FTS_LENGTH = 3
+SEARCH_MAX_LENGTH = 200
+
+RankCursor = Tuple[float, int]
+
+
+def encode_rank_cursor(rank: float, tweet_id: int) -> str:
+    raw = f"{rank!r}|{tweet_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_rank_cursor(cursor: str) -> RankCursor:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        rank, tweet_id = raw.rsplit("|", 1)
+        return float(rank), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("Invalid search cursor") from exc
+
+
+def prefix_tsquery(text: str) -> Optional[str]:
+    """Запрос to_tsquery, в котором каждое слово ищется по префиксу: «pyth fast» -> pyth:* & fast:*"""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def is_full_text(text: str) -> bool:
+    return len(text.strip()) >= SEARCH_MIN_FTS_LENGTH and prefix_tsquery(text) is not None
+
+
+def search_order(text: str, order: str) -> str:
+    """Фактический порядок выдачи: у поиска подстрокой нет релевантности"""
+    return order if is_full_text(text) else "recent"
+
+
+def decode_search_cursor(cursor: str, order: str) -> Union[RankCursor, Cursor]:
+    return decode_rank_cursor(cursor) if order == "rank" else decode_cursor(cursor)
+
+
+def search_page_query(text: str, limit: int, order: str = "rank",
+                      cursor: Optional[Union[RankCursor, Cursor]] = None, with_likes: bool = True,
+                      likes_limit: Optional[int] = None) -> Select:
+    """
+    Запрос одной страницы результатов поиска.
+
+    Запросы от SEARCH_MIN_FTS_LENGTH символов ищутся по GIN-индексу
+    search_vector; order=rank сортирует по ts_rank, order=recent - от новых
+    к старым. Короткие запросы ищутся через ILIKE, только order=recent.
+    Порядок передается уже приведенным через search_order.
+    """
+    query = select(*tweet_columns(with_likes, likes_limit)).join(User, User.id == Tweet.user_id).limit(limit)
+
+    if is_full_text(text):
+        tsquery = func.to_tsquery(literal(SEARCH_CONFIG, REGCONFIG), prefix_tsquery(text))
+        rank = func.ts_rank(Tweet.search_vector, tsquery)
+        query = query.add_columns(rank.label("rank")).where(Tweet.search_vector.bool_op("@@")(tsquery))
+    else:
+        pattern = text.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+        query = query.where(Tweet.content.ilike(f"%{pattern}%", escape="!"))
+
+    if order == "rank":
+        query = query.order_by(rank.desc(), Tweet.id.desc())
+        if cursor is not None:
+            query = query.where(tuple_(rank, Tweet.id) < tuple_(*cursor))
+    else:
+        query = query.order_by(Tweet.created_at.desc(), Tweet.id.desc())
+        if cursor is not None:
+            query = query.where(tuple_(Tweet.created_at, Tweet.id) < tuple_(*cursor))
+    return query
+
+
+def build_search_page(rows, limit: int, order: str) -> Tuple[list, Optional[str]]:
+    """Твиты страницы поиска и курсор следующей страницы"""
+    tweets = [tweet_from_row(row) for row in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        if order == "rank":
+            next_cursor = encode_rank_cursor(last.rank, last.id)
+        else:
+            next_cursor = encode_cursor(last.created_at, last.id)
+    return tweets, next_cursor
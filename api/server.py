@@ -0,0 +1,102 @@
+"""
+Запуск приложения в production-режиме: несколько процессов-воркеров
+uvicorn на одном сокете, цикл событий uvloop и HTTP-парсер httptools.
+
+    WEB_WORKERS=4 python server.py
+
+Каждый воркер импортирует приложение заново и создает собственные пулы
+соединений с базой (DB_POOL_SIZE + DB_MAX_OVERFLOW на воркер) в
+lifespan-обработчике main.lifespan. По SIGTERM/SIGINT воркеры перестают
+принимать соединения, закрывают потоки /api/events и дожидаются текущих
+запросов не дольше WEB_GRACEFUL_TIMEOUT секунд. События /api/events и
+метрики /api/metrics при нескольких воркерах общие (prepare_workers_environment).
+"""
+import logging
+import os
+import shutil
+import tempfile
+from typing import List, Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from database import config
+
+WEB_HOST = config.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(config.get("WEB_PORT", 8000))
+# По умолчанию по воркеру на ядро
+WEB_WORKERS = int(config.get("WEB_WORKERS") or os.cpu_count() or 1)
+# Сколько секунд держать простаивающее keep-alive соединение
+WEB_KEEPALIVE = int(config.get("WEB_KEEPALIVE", 5))
+# Очередь еще не принятых соединений сокета (listen backlog)
+WEB_BACKLOG = int(config.get("WEB_BACKLOG", 2048))
+# Сколько секунд ждать завершения текущих запросов при остановке
+WEB_GRACEFUL_TIMEOUT = int(config.get("WEB_GRACEFUL_TIMEOUT", 30))
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    Сервер, который перед ожиданием текущих запросов закрывает подписки
+    на поток событий: бесконечные ответы /api/events иначе держали бы
+    остановку до WEB_GRACEFUL_TIMEOUT. Клиенты получают событие reset и
+    переподключаются к другому воркеру.
+    """
+
+    async def shutdown(self, sockets: Optional[List] = None) -> None:
+        from events import event_hub
+
+        event_hub.reset_all()
+        await super().shutdown(sockets)
+
+
+def build_config(workers: int = WEB_WORKERS, port: int = WEB_PORT) -> uvicorn.Config:
+    return uvicorn.Config(
+        "main:app",
+        host=WEB_HOST,
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        backlog=WEB_BACKLOG,
+        timeout_keep_alive=WEB_KEEPALIVE,
+        timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+def prepare_workers_environment() -> None:
+    """
+    Общее состояние воркеров через переменные окружения, которые
+    наследуют процессы-воркеры: события ходят через Postgres
+    (LISTEN/NOTIFY), а метрики Prometheus пишутся в общий каталог.
+    """
+    if config.get("EVENTS_BROKER", "local") != "postgres":
+        logger.warning("EVENTS_BROKER=postgres is used: local events do not reach other workers")
+        os.environ["EVENTS_BROKER"] = "postgres"
+
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Файлы прошлого запуска искажали бы суммы
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+
+def main() -> None:
+    config = build_config()
+    server = DrainingServer(config)
+    if config.workers > 1:
+        prepare_workers_environment()
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
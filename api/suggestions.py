@@ -0,0 +1,74 @@
+from typing import List
+
+from sqlalchemy import Select, and_, exists, func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth import TTLCache
+from database import config
+from models import User, association_table
+
+SUGGESTIONS_MAX_SIZE = 50
+# Сколько подписок пользователя и подписок каждой из них учитывается при подборе:
+# объем работы запроса ограничен их произведением при любом числе подписок
+SUGGESTIONS_SOURCE_LIMIT = int(config.get("SUGGESTIONS_SOURCE_LIMIT", 500))
+SUGGESTIONS_PER_SOURCE_LIMIT = int(config.get("SUGGESTIONS_PER_SOURCE_LIMIT", 100))
+SUGGESTIONS_CACHE_SIZE = int(config.get("SUGGESTIONS_CACHE_SIZE", 10000))
+# Подписки других пользователей (и свои, обработанные другим воркером) меняют рекомендации через TTL
+SUGGESTIONS_CACHE_TTL = float(config.get("SUGGESTIONS_CACHE_TTL", 30))
+
+suggestion_cache: TTLCache[int, List[dict]] = TTLCache(SUGGESTIONS_CACHE_SIZE, SUGGESTIONS_CACHE_TTL)
+
+
+def suggestions_query(user_id: int, limit: int = SUGGESTIONS_MAX_SIZE) -> Select:
+    """
+    Кого читают мои подписки, но не читаю я: один запрос по графу подписок.
+
+    Кандидаты ранжируются по числу моих подписок, которые на них подписаны
+    (mutual_count). Подписки и подписки подписок читаются по первичному
+    ключу association_table с ограничениями SUGGESTIONS_*_LIMIT.
+    """
+    sources = (
+        select(association_table.c.following_id.label("source_id"))
+        .where(association_table.c.subscriber_id == user_id)
+        .limit(SUGGESTIONS_SOURCE_LIMIT)
+        .cte("sources")
+    )
+    second = association_table.alias("second")
+    candidates = (
+        select(second.c.following_id.label("candidate_id"))
+        .where(second.c.subscriber_id == sources.c.source_id)
+        .limit(SUGGESTIONS_PER_SOURCE_LIMIT)
+        .lateral("candidates")
+    )
+    followed = association_table.alias("followed")
+    ranked = (
+        select(candidates.c.candidate_id, func.count().label("mutual_count"))
+        .select_from(sources.join(candidates, true()))
+        .where(
+            candidates.c.candidate_id != user_id,
+            ~exists().where(and_(
+                followed.c.subscriber_id == user_id,
+                followed.c.following_id == candidates.c.candidate_id,
+            )),
+        )
+        .group_by(candidates.c.candidate_id)
+        .order_by(func.count().desc(), candidates.c.candidate_id)
+        .limit(limit)
+        .subquery("ranked")
+    )
+    return (
+        select(User.id, User.name, ranked.c.mutual_count)
+        .join(ranked, ranked.c.candidate_id == User.id)
+        .order_by(ranked.c.mutual_count.desc(), User.id)
+    )
+
+
+async def get_suggestions(session: AsyncSession, user_id: int) -> List[dict]:
+    """Рекомендации пользователя из кэша или из базы (SUGGESTIONS_MAX_SIZE штук)"""
+
+    suggestions = suggestion_cache.get(user_id)
+    if suggestions is None:
+        res = await session.execute(suggestions_query(user_id))
+        suggestions = [{"id": row.id, "name": row.name, "mutual_count": row.mutual_count} for row in res]
+        suggestion_cache.put(user_id, suggestions)
+    return suggestions
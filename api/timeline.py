@@ -0,0 +1,303 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import (
+    Boolean, DateTime, Integer, Select, column, delete, func, literal, select, true, tuple_, union_all, values
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import async_session, config
+from feed import Cursor
+from models import Tweet, TimelineEntry, User, association_table
+
+# Авторы с большим числом подписчиков не рассылают твиты по лентам:
+# их твиты подмешиваются в ленту подписчика при чтении
+FANOUT_FOLLOWER_LIMIT = int(config.get("TIMELINE_FANOUT_FOLLOWER_LIMIT", 10000))
+# Сколько последних твитов автора добавляется в ленту после подписки
+TIMELINE_BACKFILL_SIZE = int(config.get("TIMELINE_BACKFILL_SIZE", 200))
+# Сколько последних записей хранится в ленте пользователя; более старые удаляет TimelineTrimmer
+TIMELINE_MAX_SIZE = int(config.get("TIMELINE_MAX_SIZE", 800))
+# Сколько пользователей обрабатывается одной транзакцией и период запуска, сек.
+TIMELINE_TRIM_BATCH_SIZE = int(config.get("TIMELINE_TRIM_BATCH_SIZE", 1000))
+TIMELINE_TRIM_INTERVAL_SECONDS = float(config.get("TIMELINE_TRIM_INTERVAL_SECONDS", 600))
+# Ключ сессионной pg_try_advisory_lock: обход лент выполняет один воркер
+TRIM_LOCK_KEY = 7_301_003
+
+logger = logging.getLogger(__name__)
+
+
+def _following_ids(user_id: int) -> Select:
+    return select(association_table.c.following_id).where(association_table.c.subscriber_id == user_id)
+
+
+async def is_fanout_on_read(session: AsyncSession, author_id: int) -> bool:
+    """Превышает ли число подписчиков автора порог рассылки при записи"""
+
+    followers = (
+        select(literal(1))
+        .where(association_table.c.following_id == author_id)
+        .limit(FANOUT_FOLLOWER_LIMIT + 1)
+        .subquery()
+    )
+    count = await session.scalar(select(func.count()).select_from(followers))
+    return count > FANOUT_FOLLOWER_LIMIT
+
+
+async def fanout_on_read_authors(session: AsyncSession, author_ids: Iterable[int]) -> Set[int]:
+    """Авторы из списка, чьи твиты не рассылаются при записи (пакетный вариант is_fanout_on_read)"""
+
+    authors = select(User.id.label("author_id")).where(User.id.in_(list(author_ids))).subquery("authors")
+    followers = (
+        select(literal(1))
+        .where(association_table.c.following_id == authors.c.author_id)
+        .limit(FANOUT_FOLLOWER_LIMIT + 1)
+        .correlate(authors)
+        .subquery()
+    )
+    count = select(func.count()).select_from(followers).scalar_subquery()
+    res = await session.execute(select(authors.c.author_id).where(count > FANOUT_FOLLOWER_LIMIT))
+    return set(res.scalars())
+
+
+async def fan_out_tweet(session: AsyncSession, tweet_id: int, author_id: int,
+                        created_at: datetime, to_followers: bool = True) -> None:
+    """Рассылка нового твита в ленту автора и, при необходимости, его подписчиков"""
+
+    recipients = select(literal(author_id).label("user_id"))
+    if to_followers:
+        recipients = union_all(
+            recipients,
+            select(association_table.c.subscriber_id).where(association_table.c.following_id == author_id),
+        )
+    recipients = recipients.subquery()
+
+    await session.execute(
+        pg_insert(TimelineEntry).from_select(
+            ["user_id", "tweet_id", "created_at"],
+            select(recipients.c.user_id, literal(tweet_id), literal(created_at)),
+        ).on_conflict_do_nothing()
+    )
+
+
+class NewTweet(NamedTuple):
+    tweet_id: int
+    author_id: int
+    created_at: datetime
+    to_followers: bool
+
+
+async def fan_out_tweets(session: AsyncSession, tweets: List[NewTweet]) -> None:
+    """Рассылка нескольких новых твитов одним запросом (пакетный вариант fan_out_tweet)"""
+
+    new_tweet_rows = values(
+        column("tweet_id", Integer),
+        column("author_id", Integer),
+        column("created_at", DateTime(timezone=True)),
+        column("to_followers", Boolean),
+        name="new_tweet_rows",
+    ).data(tweets)
+    new_tweets = select(new_tweet_rows).cte("new_tweets")
+    recipients = union_all(
+        select(new_tweets.c.author_id, new_tweets.c.tweet_id, new_tweets.c.created_at),
+        select(association_table.c.subscriber_id, new_tweets.c.tweet_id, new_tweets.c.created_at)
+        .join(new_tweets, association_table.c.following_id == new_tweets.c.author_id)
+        .where(new_tweets.c.to_followers),
+    )
+    await session.execute(
+        pg_insert(TimelineEntry)
+        .from_select(["user_id", "tweet_id", "created_at"], recipients)
+        .on_conflict_do_nothing()
+    )
+
+
+async def backfill_from_author(session: AsyncSession, user_id: int, author_id: int) -> None:
+    """Добавление последних твитов автора в ленту пользователя после подписки"""
+    await backfill_from_authors(session, user_id, [author_id])
+
+
+async def backfill_from_authors(session: AsyncSession, user_id: int, author_ids: List[int]) -> None:
+    """Добавление последних твитов нескольких авторов в ленту пользователя одним запросом"""
+
+    authors = select(User.id.label("author_id")).where(User.id.in_(author_ids)).subquery("authors")
+    recent = (
+        select(Tweet.id, Tweet.created_at)
+        .where(Tweet.user_id == authors.c.author_id, Tweet.fanout_on_read.is_(False))
+        .order_by(Tweet.created_at.desc(), Tweet.id.desc())
+        .limit(TIMELINE_BACKFILL_SIZE)
+        .lateral("recent")
+    )
+    await session.execute(
+        pg_insert(TimelineEntry)
+        .from_select(
+            ["user_id", "tweet_id", "created_at"],
+            select(literal(user_id), recent.c.id, recent.c.created_at).select_from(authors.join(recent, true())),
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+async def remove_author_from_timeline(session: AsyncSession, user_id: int, author_id: int) -> None:
+    """Удаление твитов автора из ленты пользователя после отписки"""
+    await remove_authors_from_timeline(session, user_id, [author_id])
+
+
+async def remove_authors_from_timeline(session: AsyncSession, user_id: int, author_ids: List[int]) -> None:
+    """Удаление твитов нескольких авторов из ленты пользователя одним запросом"""
+
+    await session.execute(
+        delete(TimelineEntry).where(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.tweet_id.in_(select(Tweet.id).where(Tweet.user_id.in_(author_ids))),
+        )
+    )
+
+
+def home_timeline_ids(user_id: int, limit: int, cursor: Optional[Cursor] = None) -> Select:
+    """
+    Id твитов одной страницы домашней ленты.
+
+    Разосланные твиты читаются диапазоном по индексу ленты пользователя,
+    твиты авторов с рассылкой при чтении - для каждого такого автора
+    отдельно (LATERAL) не более limit строк по частичному индексу
+    ix_tweets_fanout_on_read, так что страница не зависит от размера tweets.
+    """
+    materialized = (
+        select(TimelineEntry.tweet_id.label("id"), TimelineEntry.created_at)
+        .where(TimelineEntry.user_id == user_id)
+        .order_by(TimelineEntry.created_at.desc(), TimelineEntry.tweet_id.desc())
+        .limit(limit)
+    )
+    authors = _following_ids(user_id).subquery("authors")
+    author_tweets = (
+        select(Tweet.id, Tweet.created_at)
+        .where(Tweet.user_id == authors.c.following_id, Tweet.fanout_on_read)
+        .order_by(Tweet.created_at.desc(), Tweet.id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        materialized = materialized.where(tuple_(TimelineEntry.created_at, TimelineEntry.tweet_id) < tuple_(*cursor))
+        author_tweets = author_tweets.where(tuple_(Tweet.created_at, Tweet.id) < tuple_(*cursor))
+    author_tweets = author_tweets.lateral("author_tweets")
+    on_read = (
+        select(author_tweets.c.id, author_tweets.c.created_at)
+        .select_from(authors.join(author_tweets, true()))
+        .order_by(author_tweets.c.created_at.desc(), author_tweets.c.id.desc())
+        .limit(limit)
+    )
+
+    page = union_all(materialized, on_read).subquery()
+    return select(page.c.id)
+
+
+class TrimBatch(NamedTuple):
+    last_user_id: Optional[int]
+    deleted: int
+
+
+async def trim_timelines(session: AsyncSession, after_user_id: int = 0, max_size: int = TIMELINE_MAX_SIZE,
+                         batch_size: int = TIMELINE_TRIM_BATCH_SIZE) -> TrimBatch:
+    """
+    Удаление записей лент старше max_size последних у пачки пользователей
+    с id больше after_user_id в текущей транзакции.
+
+    Для каждого пользователя граница ищется по индексу ленты (OFFSET
+    max_size), поэтому стоимость не зависит от длины ленты сверх max_size.
+    Возвращает id последнего обработанного пользователя (None, если
+    пользователи закончились) и число удаленных записей.
+    """
+    user_ids = list(await session.scalars(
+        select(User.id).where(User.id > after_user_id).order_by(User.id).limit(batch_size)
+    ))
+    if not user_ids:
+        return TrimBatch(None, 0)
+
+    users = select(User.id.label("user_id")).where(User.id.in_(user_ids)).subquery("batch_users")
+    boundary = (
+        select(TimelineEntry.created_at, TimelineEntry.tweet_id)
+        .where(TimelineEntry.user_id == users.c.user_id)
+        .order_by(TimelineEntry.created_at.desc(), TimelineEntry.tweet_id.desc())
+        .offset(max_size)
+        .limit(1)
+        .lateral("boundary")
+    )
+    trimmed = (
+        select(users.c.user_id, boundary.c.created_at, boundary.c.tweet_id)
+        .select_from(users.join(boundary, true()))
+        .subquery("trimmed")
+    )
+    res_deleted = await session.execute(
+        delete(TimelineEntry).where(
+            TimelineEntry.user_id == trimmed.c.user_id,
+            tuple_(TimelineEntry.created_at, TimelineEntry.tweet_id)
+            <= tuple_(trimmed.c.created_at, trimmed.c.tweet_id),
+        )
+    )
+    return TrimBatch(user_ids[-1], res_deleted.rowcount)
+
+
+class TimelineTrimmer:
+    """Фоновая обрезка лент до TIMELINE_MAX_SIZE записей раз в TIMELINE_TRIM_INTERVAL_SECONDS"""
+
+    def __init__(self, session_factory: async_sessionmaker = async_session,
+                 interval: float = TIMELINE_TRIM_INTERVAL_SECONDS, max_size: int = TIMELINE_MAX_SIZE,
+                 batch_size: int = TIMELINE_TRIM_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def trim(self) -> int:
+        """
+        Обход всех пользователей пачками; возвращает число удаленных записей.
+
+        Блокировка TRIM_LOCK_KEY держится на отдельном соединении весь обход,
+        а не одну транзакцию пачки, поэтому другие воркеры пропускают запуск
+        целиком. Если обход уже идет в другом воркере, возвращает 0.
+        """
+        async with self.session_factory() as lock_session:
+            connection = await lock_session.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+            if not await connection.scalar(select(func.pg_try_advisory_lock(TRIM_LOCK_KEY))):
+                return 0
+            try:
+                return await self._trim_batches()
+            finally:
+                await connection.scalar(select(func.pg_advisory_unlock(TRIM_LOCK_KEY)))
+
+    async def _trim_batches(self) -> int:
+        deleted = 0
+        after_user_id = 0
+        while True:
+            async with self.session_factory() as session:
+                batch = await trim_timelines(session, after_user_id, self.max_size, self.batch_size)
+                if batch.last_user_id is None:
+                    return deleted
+                await session.commit()
+            deleted += batch.deleted
+            after_user_id = batch.last_user_id
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                deleted = await self.trim()
+                if deleted:
+                    logger.info("Trimmed %d timeline entries", deleted)
+            except Exception:
+                logger.exception("Failed to trim timelines")
+            await asyncio.sleep(self.interval)
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+timeline_trimmer = TimelineTrimmer()
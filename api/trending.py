@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import (
+    CTE, Column, Float, Integer, MetaData, Select, Table, case, delete, extract, func, literal, select, text, update
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.schema import CreateTable
+
+from database import async_session, config
+from feed import tweet_columns
+from models import Like, Tweet, TrendingScore, User
+
+logger = logging.getLogger(__name__)
+
+# Через сколько часов вклад лайка в популярность уменьшается вдвое
+TRENDING_HALF_LIFE_HOURS = float(config.get("TRENDING_HALF_LIFE_HOURS", 6))
+# Лайки старше окна не учитываются при пересчете
+TRENDING_WINDOW_HOURS = float(config.get("TRENDING_WINDOW_HOURS", 48))
+# Период полного пересчета таблицы trending фоновой задачей, сек.
+TRENDING_REFRESH_SECONDS = float(config.get("TRENDING_REFRESH_SECONDS", 300))
+TRENDING_MAX_SIZE = 100
+
+# Начало отсчета для log_score: вклад лайка exp((t - epoch) / tau) растет со временем,
+# поэтому новые лайки весят больше старых без пересчета уже сохраненных оценок
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+TAU_SECONDS = TRENDING_HALF_LIFE_HOURS * 3600 / math.log(2)
+# Ключ pg_try_advisory_xact_lock: пересчет выполняет один воркер
+REFRESH_LOCK_KEY = 7_301_018
+
+
+# Свежие оценки считаются до того, как затрагиваются строки trending
+_fresh_scores = Table(
+    "trending_fresh", MetaData(),
+    Column("tweet_id", Integer, nullable=False),
+    Column("log_score", Float, nullable=False),
+    prefixes=["TEMPORARY"], postgresql_on_commit="DROP",
+)
+
+
+def like_weight(created_at):
+    """ln вклада лайка: (created_at - TRENDING_EPOCH) / tau"""
+    return (extract("epoch", created_at) - TRENDING_EPOCH.timestamp()) / TAU_SECONDS
+
+
+def _exp(value):
+    """exp для отрицательных аргументов: Postgres считает ошибкой исчезновение порядка"""
+    return func.exp(func.greatest(value, -700))
+
+
+def _log_add(a, b):
+    """ln(exp(a) + exp(b)) без переполнения"""
+    return func.greatest(a, b) + func.ln(1 + _exp(-func.abs(a - b)))
+
+
+def add_likes_cte(inserted: CTE) -> CTE:
+    """
+    Учет новых лайков в trending; inserted - CTE со столбцами tweet_id и
+    created_at вставленных строк likes. Время вставки у всех строк одного
+    запроса одинаковое, поэтому n лайков твита дают вклад weight + ln(n).
+    """
+    added = (
+        select(
+            inserted.c.tweet_id,
+            (func.max(like_weight(inserted.c.created_at)) + func.ln(func.count())).label("log_score"),
+        )
+        .group_by(inserted.c.tweet_id)
+    )
+    upsert = pg_insert(TrendingScore).from_select(["tweet_id", "log_score"], added)
+    return (
+        upsert.on_conflict_do_update(
+            index_elements=["tweet_id"],
+            set_={"log_score": _log_add(TrendingScore.log_score, upsert.excluded.log_score)},
+        )
+        .returning(TrendingScore.tweet_id)
+        .cte("trending_added")
+    )
+
+
+def remove_likes_cte(deleted: CTE) -> CTE:
+    """
+    Вычитание вклада удаленных лайков из trending; deleted - CTE со
+    столбцами tweet_id и created_at, не больше одной строки на твит.
+    Если вклад был последним, оценка становится -inf до пересчета.
+    """
+    difference = like_weight(deleted.c.created_at) - TrendingScore.log_score
+    return (
+        update(TrendingScore)
+        .where(TrendingScore.tweet_id == deleted.c.tweet_id)
+        .values(log_score=case(
+            (difference < -1e-6, TrendingScore.log_score + func.ln(1 - _exp(difference))),
+            else_=literal(-math.inf),
+        ))
+        .returning(TrendingScore.tweet_id)
+        .cte("trending_removed")
+    )
+
+
+def trending_page_query(limit: int, with_likes: bool = True, likes_limit: Optional[int] = None) -> Select:
+    """Top-K по убыванию log_score: K строк индекса ix_trending_log_score"""
+    return (
+        select(*tweet_columns(with_likes, likes_limit), TrendingScore.log_score)
+        .select_from(TrendingScore)
+        .join(Tweet, Tweet.id == TrendingScore.tweet_id)
+        .join(User, User.id == Tweet.user_id)
+        .where(TrendingScore.log_score > -math.inf)
+        .order_by(TrendingScore.log_score.desc())
+        .limit(limit)
+    )
+
+
+def current_score(log_score: float, now: Optional[datetime] = None) -> float:
+    """Затухшая популярность на момент now: сумма весов лайков, свежий лайк весит 1"""
+    now = now or datetime.now(timezone.utc)
+    return math.exp(log_score - (now - TRENDING_EPOCH).total_seconds() / TAU_SECONDS)
+
+
+async def refresh_trending(session) -> bool:
+    """
+    Полный пересчет trending по лайкам за TRENDING_WINDOW_HOURS.
+
+    Исправляет накопленную погрешность инкрементальных обновлений и
+    удаляет твиты без лайков в окне. Оценки сначала считаются во временную
+    таблицу, поэтому строки trending блокируются только на короткие upsert
+    и удаление, а не на время агрегации лайков. Если пересчет уже идет в
+    другом воркере, ничего не делает и возвращает False.
+    """
+    locked = await session.scalar(select(func.pg_try_advisory_xact_lock(REFRESH_LOCK_KEY)))
+    if not locked:
+        return False
+
+    weight = like_weight(Like.created_at)
+    scored = (
+        select(
+            Like.tweet_id,
+            weight.label("weight"),
+            func.max(weight).over(partition_by=Like.tweet_id).label("max_weight"),
+        )
+        .where(Like.created_at > func.now() - text(f"interval '{TRENDING_WINDOW_HOURS} hours'"))
+        .subquery()
+    )
+    # ln(sum(exp(w))) = max(w) + ln(sum(exp(w - max(w)))) без переполнения exp
+    fresh = (
+        select(
+            scored.c.tweet_id,
+            (func.max(scored.c.max_weight) + func.ln(func.sum(_exp(scored.c.weight - scored.c.max_weight))))
+            .label("log_score"),
+        )
+        .group_by(scored.c.tweet_id)
+    )
+    await session.execute(CreateTable(_fresh_scores))
+    await session.execute(_fresh_scores.insert().from_select(["tweet_id", "log_score"], fresh))
+
+    upsert = pg_insert(TrendingScore).from_select(
+        ["tweet_id", "log_score"], select(_fresh_scores.c.tweet_id, _fresh_scores.c.log_score)
+    )
+    await session.execute(
+        upsert.on_conflict_do_update(
+            index_elements=["tweet_id"],
+            set_={"log_score": upsert.excluded.log_score},
+            where=TrendingScore.log_score.is_distinct_from(upsert.excluded.log_score),
+        )
+    )
+    await session.execute(
+        delete(TrendingScore).where(TrendingScore.tweet_id.not_in(select(_fresh_scores.c.tweet_id)))
+    )
+    return True
+
+
+class TrendingRefresher:
+    """Фоновый пересчет trending раз в TRENDING_REFRESH_SECONDS"""
+
+    def __init__(self, session_factory: async_sessionmaker = async_session,
+                 interval: float = TRENDING_REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    if await refresh_trending(session):
+                        await session.commit()
+            except Exception:
+                logger.exception("Failed to refresh trending scores")
+            await asyncio.sleep(self.interval)
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+trending_refresher = TrendingRefresher()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк групповой фиксации записей.
+
+Сравнивает пропускную способность записи твитов и лайков при
+--concurrency параллельных клиентах: по одной транзакции на запрос
+(как в обычном режиме эндпойнтов) и через GroupCommitWriter
+(режим WRITE_BATCHING=true). Нужна база, заполненная benchmarks/seed.py:
+
+    POSTGRES_HOST=localhost python benchmarks/bench_group_commit.py --users 100000 --tweets 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+API_DIR = Path(__file__).resolve().parents[1] / "api"
+sys.path.insert(0, str(API_DIR))
+os.chdir(API_DIR)
+
+from sqlalchemy import insert  # noqa: E402
+
+from database import async_session, engine  # noqa: E402
+from group_commit import GroupCommitWriter  # noqa: E402
+from likes import like_statement  # noqa: E402
+from models import Tweet  # noqa: E402
+from timeline import fan_out_tweet, is_fanout_on_read  # noqa: E402
+
+
+async def direct_tweet(user_id: int) -> None:
+    async with async_session() as session:
+        fanout_on_read = await is_fanout_on_read(session, user_id)
+        res_tweet = await session.execute(
+            insert(Tweet).values(content="group commit", user_id=user_id, fanout_on_read=fanout_on_read)
+            .returning(Tweet.id, Tweet.created_at)
+        )
+        tweet_id, created_at = res_tweet.one()
+        await fan_out_tweet(session, tweet_id, user_id, created_at, to_followers=not fanout_on_read)
+        await session.commit()
+
+
+async def direct_like(user_id: int, tweet_id: int) -> None:
+    async with async_session() as session:
+        await session.execute(like_statement(user_id, tweet_id))
+        await session.commit()
+
+
+async def measure(operation: Callable[[], Awaitable], concurrency: int, duration: float) -> dict:
+    latencies: List[float] = []
+
+    async def client(deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await operation()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(started + duration) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "ops": len(latencies),
+        "ops_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49], 2),
+        "p99_ms": round(quantiles[98], 2),
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    writer = GroupCommitWriter(max_size=args.batch_size, max_delay_ms=args.delay_ms)
+
+    def user() -> int:
+        return random.randint(1, args.users)
+
+    def tweet() -> int:
+        return random.randint(1, args.tweets)
+
+    cases = {
+        "tweets, direct": lambda: direct_tweet(user()),
+        "tweets, group commit": lambda: writer.add_tweet(user(), "group commit"),
+        "likes, direct": lambda: direct_like(user(), tweet()),
+        "likes, group commit": lambda: writer.add_like(user(), tweet()),
+    }
+    print(f"concurrency={args.concurrency} batch_size={args.batch_size} delay_ms={args.delay_ms}")
+    for name, operation in cases.items():
+        result = await measure(operation, args.concurrency, args.duration)
+        print(f"{name:<22} {result['ops']:>8} ops  {result['ops_per_s']:>9} ops/s  "
+              f"p50 {result['p50_ms']:>7} ms  p99 {result['p99_ms']:>7} ms")
+
+    await writer.shutdown()
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000, help="число пользователей в базе (см. seed.py)")
+    parser.add_argument("--tweets", type=int, default=1000000, help="число твитов в базе (см. seed.py)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10, help="длительность каждого замера, сек.")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--delay-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Бенчмарк поиска твитов.
+
+Для набора запросов сравнивает полнотекстовый поиск эндпойнта /tweets/search
+(GIN-индекс по search_vector, порядок rank и recent) с наивным поиском
+подстрокой ILIKE '%...%' по всей таблице. Для каждого варианта выводится
+медианное время и узел плана, которым читается таблица tweets. Нужна база,
+заполненная benchmarks/seed.py (миллионы твитов):
+
+    POSTGRES_HOST=localhost python benchmarks/bench_search.py --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parents[1] / "api"
+sys.path.insert(0, str(API_DIR))
+os.chdir(API_DIR)
+
+from sqlalchemy import select  # noqa: E402
+
+from database import async_session, engine  # noqa: E402
+from feed import FEED_PAGE_SIZE  # noqa: E402
+from models import Tweet  # noqa: E402
+from search import search_order, search_page_query  # noqa: E402
+
+# Слова словаря seed.py: частые, сочетания, префиксы и отсутствующее слово
+QUERIES = ("python", "coffee monday", "deploy bug fix", "pyth", "mus tra", "zzzz", "he")
+
+
+def naive_query(text: str):
+    return (
+        select(Tweet.id, Tweet.content)
+        .where(Tweet.content.ilike(f"%{text}%"))
+        .order_by(Tweet.created_at.desc(), Tweet.id.desc())
+        .limit(FEED_PAGE_SIZE)
+    )
+
+
+def scan_nodes(node: dict):
+    if node.get("Relation Name") == "tweets":
+        yield node.get("Index Name") or node["Node Type"]
+    for child in node.get("Plans", []):
+        yield from scan_nodes(child)
+
+
+async def measure(session, statement, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await session.execute(statement)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    compiled = statement.compile(dialect=engine.dialect)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    connection = await session.connection()
+    res = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", parameters)
+    plan = res.scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return {"median_ms": statistics.median(timings), "scan": ", ".join(sorted(set(scan_nodes(plan[0]["Plan"]))))}
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with async_session() as session:
+        total = await session.scalar(select(Tweet.id).order_by(Tweet.id.desc()).limit(1))
+        print(f"tweets: ~{total}, repeat={args.repeat}")
+        print(f"{'query':<16} {'variant':<14} {'median, ms':>11}  tweets scan")
+        for text in QUERIES:
+            variants = {
+                "search rank": search_page_query(text, FEED_PAGE_SIZE, search_order(text, "rank"), with_likes=False),
+                "search recent": search_page_query(text, FEED_PAGE_SIZE, "recent", with_likes=False),
+                "ILIKE": naive_query(text),
+            }
+            for name, statement in variants.items():
+                result = await measure(session, statement, args.repeat)
+                print(f"{text:<16} {name:<14} {result['median_ms']:>11.2f}  {result['scan']}")
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
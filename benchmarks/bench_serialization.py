@@ -0,0 +1,91 @@
+"""
+Микробенчмарк сериализации ленты из 1000 твитов.
+
+Сравнивает прежний путь ответа (jsonable_encoder + JSONResponse,
+с валидацией response_model и без нее) и ORJSONResponse.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_serialization.py --tweets 1000 --repeat 50
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "api"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+
+from schemas import FeedOut  # noqa: E402
+
+
+def make_feed(tweets: int, likes_per_tweet: int = 10, media_per_tweet: int = 2) -> dict:
+    url = "api/api/images/" + "0" * 64
+    return {
+        "result": True,
+        "next_cursor": "MjAyNi0xMC0xN1QxMjowMDowMCswMDowMHwx",
+        "tweets": [
+            {
+                "id": tweet_id,
+                "content": f"Tweet number {tweet_id} " * 5,
+                "attachments": [f"{url}-feed.jpg"] * media_per_tweet,
+                "media": [
+                    {"url": f"{url}.jpg", "thumbnail": f"{url}-thumbnail.jpg",
+                     "feed": f"{url}-feed.jpg", "webp": f"{url}-webp.webp"}
+                ] * media_per_tweet,
+                "author": {"id": tweet_id % 100, "name": "Samantha"},
+                "like_count": likes_per_tweet,
+                "likes": [{"user_id": user_id, "name": "Erik"} for user_id in range(likes_per_tweet)],
+            }
+            for tweet_id in range(tweets)
+        ],
+    }
+
+
+def encode_jsonable(payload: dict) -> bytes:
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def encode_response_model(payload: dict) -> bytes:
+    return JSONResponse(content=jsonable_encoder(FeedOut(**payload))).body
+
+
+def encode_orjson(payload: dict) -> bytes:
+    return ORJSONResponse(payload).body
+
+
+def measure(encode, payload: dict, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode(payload)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": statistics.median(timings), "min_ms": min(timings), "bytes": len(body)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tweets", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    payload = make_feed(args.tweets)
+    cases = {
+        "jsonable_encoder + JSONResponse": encode_jsonable,
+        "response_model + jsonable_encoder": encode_response_model,
+        "ORJSONResponse": encode_orjson,
+    }
+    results = {name: measure(encode, payload, args.repeat) for name, encode in cases.items()}
+    baseline = results["jsonable_encoder + JSONResponse"]["median_ms"]
+
+    print(f"Feed of {args.tweets} tweets, {args.repeat} runs")
+    for name, result in results.items():
+        print(f"{name:<36} median {result['median_ms']:8.2f} ms  min {result['min_ms']:8.2f} ms  "
+              f"x{baseline / result['median_ms']:5.1f}  {result['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
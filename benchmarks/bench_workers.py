@@ -0,0 +1,134 @@
+"""
+Бенчмарк масштабирования по числу воркеров.
+
+Для каждого значения --workers запускает api/server.py (uvloop, httptools)
+с WEB_WORKERS=N, нагружает его по сети запросами GET /api/tweets и
+GET /api/users/{id} из --client-processes процессов-клиентов и выводит
+пропускную способность, p50/p99 и ускорение относительно первого замера.
+Сервер останавливается сигналом SIGTERM, как при штатном выключении.
+Нужна база, заполненная benchmarks/seed.py:
+
+    POSTGRES_HOST=localhost python benchmarks/bench_workers.py --workers 1,2,4,8 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+import httpx
+
+API_DIR = Path(__file__).resolve().parents[1] / "api"
+
+
+async def client_loop(base_url: str, users: int, concurrency: int, duration: float,
+                      seed: int) -> Tuple[List[float], int]:
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(deadline: float) -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                headers = {"api-key": f"key-{rng.randint(1, users)}"}
+                if rng.random() < 0.7:
+                    request = client.get("/api/tweets", headers=headers)
+                else:
+                    request = client.get(f"/api/users/{rng.randint(1, users)}", headers=headers)
+                started = time.perf_counter()
+                try:
+                    response = await request
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code >= 400:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(worker(deadline) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(base_url: str, users: int, concurrency: int, duration: float, seed: int) -> Tuple[List[float], int]:
+    return asyncio.run(client_loop(base_url, users, concurrency, duration, seed))
+
+
+def wait_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/metrics", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def measure(args: argparse.Namespace, workers: int) -> dict:
+    env = {**os.environ, "WEB_WORKERS": str(workers), "WEB_PORT": str(args.port)}
+    server = subprocess.Popen([sys.executable, "server.py"], cwd=API_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(base_url)
+        run_client(base_url, args.users, args.concurrency, 2, args.seed)  # прогрев пулов и кэшей
+        per_process = max(args.concurrency // args.client_processes, 1)
+        with ProcessPoolExecutor(args.client_processes) as pool:
+            futures = [
+                pool.submit(run_client, base_url, args.users, per_process, args.duration, args.seed + index)
+                for index in range(args.client_processes)
+            ]
+            results = [future.result() for future in futures]
+        latencies = [latency for result, _ in results for latency in result]
+        errors = sum(count for _, count in results)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    if len(latencies) < 2:
+        raise RuntimeError(f"{errors} failed requests, check the database and seed.py data")
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / args.duration,
+        "p50_ms": quantiles[49],
+        "p99_ms": quantiles[98],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="список числа воркеров через запятую")
+    parser.add_argument("--users", type=int, default=100000, help="число пользователей в базе (см. seed.py)")
+    parser.add_argument("--concurrency", type=int, default=128, help="одновременных запросов всего")
+    parser.add_argument("--client-processes", type=int, default=4, help="процессов, генерирующих нагрузку")
+    parser.add_argument("--duration", type=float, default=20, help="длительность замера, сек.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"concurrency={args.concurrency} client_processes={args.client_processes} duration={args.duration}s")
+    print(f"{'workers':>7} {'requests':>9} {'errors':>7} {'rps':>9} {'speedup':>8} {'p50, ms':>8} {'p99, ms':>8}")
+    baseline = None
+    for workers in (int(value) for value in args.workers.split(",")):
+        result = measure(args, workers)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+              f"{result['rps'] / baseline:>7.2f}x {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Нагрузочный тест эндпойнтов API в одном процессе.
+
+Запросы отправляются в ASGI-приложение напрямую (httpx.ASGITransport),
+без сети, от имени случайных пользователей, созданных benchmarks/seed.py.
+Для каждого эндпойнта выводятся p50/p95/p99, пропускная способность,
+доля ошибок и число SQL-запросов на один вызов. Результат сохраняется
+в JSON, чтобы сравнивать коммиты между собой:
+
+    POSTGRES_HOST=localhost python benchmarks/load_test.py --users 100000 --duration 30
+    POSTGRES_HOST=localhost python benchmarks/load_test.py --compare benchmarks/results/<файл>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+
+ROOT = Path(__file__).resolve().parents[1]
+API_DIR = ROOT / "api"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(API_DIR))
+os.chdir(API_DIR)
+
+import main  # noqa: E402
+from database import engine, read_engine  # noqa: E402
+
+
+@dataclass
+class Scenario:
+    name: str
+    weight: int
+    request: Callable
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    queries: int = 0
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов всех движков приложения"""
+
+    def __init__(self):
+        self.count = 0
+        for item in {engine, read_engine}:
+            event.listen(item.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+def build_scenarios(users: int, tweets: int, prefix: str) -> List[Scenario]:
+    def user_key() -> Dict[str, str]:
+        return {"api-key": f"key-{random.randint(1, users)}"}
+
+    async def get_feed(client: AsyncClient):
+        return await client.get(f"{prefix}/tweets", headers=user_key())
+
+    async def get_feed_page(client: AsyncClient):
+        first = await client.get(f"{prefix}/tweets", params={"limit": 20}, headers=user_key())
+        return await client.get(f"{prefix}/tweets", params={"cursor": first.json()["next_cursor"]}, headers=user_key())
+
+    async def get_home(client: AsyncClient):
+        return await client.get(f"{prefix}/tweets", params={"feed": "home"}, headers=user_key())
+
+    async def get_trending(client: AsyncClient):
+        return await client.get(f"{prefix}/tweets/trending", headers=user_key())
+
+    async def get_me(client: AsyncClient):
+        return await client.get(f"{prefix}/users/me", headers=user_key())
+
+    async def get_user(client: AsyncClient):
+        return await client.get(f"{prefix}/users/{random.randint(1, users)}", headers=user_key())
+
+    async def post_tweet(client: AsyncClient):
+        return await client.post(f"{prefix}/tweets", json={"tweet_data": "load test"}, headers=user_key())
+
+    async def like_tweet(client: AsyncClient):
+        return await client.post(f"{prefix}/tweets/{random.randint(1, tweets)}/likes", headers=user_key())
+
+    async def unlike_tweet(client: AsyncClient):
+        return await client.delete(f"{prefix}/tweets/{random.randint(1, tweets)}/likes", headers=user_key())
+
+    async def follow_user(client: AsyncClient):
+        return await client.post(f"{prefix}/users/{random.randint(1, users)}/follow", headers=user_key())
+
+    async def unfollow_user(client: AsyncClient):
+        return await client.delete(f"{prefix}/users/{random.randint(1, users)}/follow", headers=user_key())
+
+    return [
+        Scenario("GET /tweets", 30, get_feed),
+        Scenario("GET /tweets?cursor", 5, get_feed_page),
+        Scenario("GET /tweets?feed=home", 20, get_home),
+        Scenario("GET /tweets/trending", 5, get_trending),
+        Scenario("GET /users/me", 10, get_me),
+        Scenario("GET /users/{id}", 10, get_user),
+        Scenario("POST /tweets", 5, post_tweet),
+        Scenario("POST /tweets/{id}/likes", 8, like_tweet),
+        Scenario("DELETE /tweets/{id}/likes", 4, unlike_tweet),
+        Scenario("POST /users/{id}/follow", 5, follow_user),
+        Scenario("DELETE /users/{id}/follow", 3, unfollow_user),
+    ]
+
+
+async def count_queries(client: AsyncClient, scenarios: List[Scenario], counter: QueryCounter) -> None:
+    """Число запросов к базе на один вызов каждого эндпойнта (после прогрева)"""
+    for scenario in scenarios:
+        await scenario.request(client)
+        before = counter.count
+        await scenario.request(client)
+        scenario.queries = counter.count - before
+
+
+async def worker(client: AsyncClient, scenarios: List[Scenario], deadline: float) -> None:
+    weights = [scenario.weight for scenario in scenarios]
+    while time.perf_counter() < deadline:
+        scenario = random.choices(scenarios, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await scenario.request(client)
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        scenario.latencies.append((time.perf_counter() - started) * 1000)
+        scenario.errors += failed
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(percent) - 1]
+
+
+def summarize(scenarios: List[Scenario], duration: float) -> Dict[str, dict]:
+    summary = {}
+    for scenario in scenarios:
+        if not scenario.latencies:
+            continue
+        summary[scenario.name] = {
+            "requests": len(scenario.latencies),
+            "errors": scenario.errors,
+            "rps": round(len(scenario.latencies) / duration, 1),
+            "p50_ms": round(percentile(scenario.latencies, 50), 2),
+            "p95_ms": round(percentile(scenario.latencies, 95), 2),
+            "p99_ms": round(percentile(scenario.latencies, 99), 2),
+            "queries_per_request": scenario.queries,
+        }
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_summary(summary: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    print(f"{'endpoint':<28} {'req':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>7}")
+    for name, result in summary.items():
+        line = (f"{name:<28} {result['requests']:>7} {result['errors']:>5} {result['rps']:>8} "
+                f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} "
+                f"{result['queries_per_request']:>7}")
+        if name in baseline:
+            change = (result["p95_ms"] / baseline[name]["p95_ms"] - 1) * 100 if baseline[name]["p95_ms"] else 0
+            line += f"  p95 {change:+.0f}%"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    # app отдает API по префиксу /api, app_api - от корня
+    app, prefix = (main.app, "/api") if args.app == "app" else (main.app_api, "")
+    scenarios = build_scenarios(args.users, args.tweets, prefix)
+
+    counter = QueryCounter()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        await count_queries(client, scenarios, counter)
+
+        queries_before = counter.count
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(client, scenarios, deadline) for _ in range(args.concurrency)))
+        duration = time.perf_counter() - started
+
+    summary = summarize(scenarios, duration)
+    total = sum(result["requests"] for result in summary.values())
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "total": {
+            "requests": total,
+            "rps": round(total / duration, 1),
+            "queries_per_request": round((counter.count - queries_before) / max(total, 1), 2),
+        },
+        "endpoints": summary,
+    }
+
+    baseline = {}
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["endpoints"]
+    print_summary(summary, baseline)
+    print(f"total: {result['total']}")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{result['commit']}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"saved to {output}")
+    await engine.dispose()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=("app", "app_api"), default="app", help="какое ASGI-приложение нагружать")
+    parser.add_argument("--users", type=int, default=100000, help="число пользователей в базе (см. seed.py)")
+    parser.add_argument("--tweets", type=int, default=1000000, help="число твитов в базе (см. seed.py)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="длительность нагрузки, сек.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="куда сохранить JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения p95")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
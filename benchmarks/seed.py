@@ -0,0 +1,208 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования.
+
+Заполняет базу пользователями, подписками, твитами, лайками и картинками
+со скошенным распределением: число подписчиков и лайков подчиняется
+степенному закону, поэтому есть «знаменитости» и вирусные твиты.
+Данные детерминированы при одинаковом --seed.
+
+Схема должна быть создана заранее (alembic upgrade head). Запуск из корня
+репозитория, параметры подключения берутся так же, как у приложения:
+
+    POSTGRES_HOST=localhost python benchmarks/seed.py --users 100000 --tweets 1000000 --truncate
+
+Пользователь с id N получает api-key "key-N". Таблицу trending по лайкам
+заполнит фоновый пересчет при старте приложения.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import asyncpg
+
+API_DIR = Path(__file__).resolve().parents[1] / "api"
+sys.path.insert(0, str(API_DIR))
+os.chdir(API_DIR)
+
+from database import SQLALCHEMY_DATABASE_URL  # noqa: E402
+from timeline import FANOUT_FOLLOWER_LIMIT, TIMELINE_BACKFILL_SIZE  # noqa: E402
+
+NAMES = ['Tom', 'Anna', 'Jason', 'Samantha', 'Erik', 'George', 'Julia', 'Emma']
+WORDS = ("hello world python fastapi postgres async feed like follow image cat coffee "
+         "monday release deploy bug fix weekend music travel news sport").split()
+TABLES = ("trending", "timelines", "images", "likes", "tweets", "association_table", "users")
+BATCH_SIZE = 50000
+
+
+class ZipfSampler:
+    """Выбор элементов 1..n с вероятностью, пропорциональной 1 / rank^exponent"""
+
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        ranks = list(range(1, n + 1))
+        rng.shuffle(ranks)
+        self.cum_weights = list(itertools.accumulate(1.0 / rank ** exponent for rank in ranks))
+        self.rng = rng
+
+    def sample(self) -> int:
+        point = self.rng.random() * self.cum_weights[-1]
+        return bisect.bisect_left(self.cum_weights, point) + 1
+
+
+def dsn() -> str:
+    return SQLALCHEMY_DATABASE_URL.set(drivername="postgresql", query={}).render_as_string(hide_password=False)
+
+
+async def copy_batches(conn: asyncpg.Connection, table: str, columns: tuple, records) -> int:
+    total = 0
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == BATCH_SIZE:
+            await conn.copy_records_to_table(table, records=batch, columns=columns)
+            total += len(batch)
+            batch = []
+    if batch:
+        await conn.copy_records_to_table(table, records=batch, columns=columns)
+        total += len(batch)
+    return total
+
+
+def generate_users(count: int, rng: random.Random):
+    for user_id in range(1, count + 1):
+        yield user_id, f"{rng.choice(NAMES)} {user_id}", f"key-{user_id}"
+
+
+def generate_follows(users: int, mean_following: int, exponent: float, rng: random.Random):
+    popularity = ZipfSampler(users, exponent, rng)
+    for subscriber_id in range(1, users + 1):
+        following = min(int(rng.expovariate(1 / mean_following)) + 1, users - 1)
+        targets = set()
+        for _ in range(following * 2):
+            if len(targets) == following:
+                break
+            target = popularity.sample()
+            if target != subscriber_id:
+                targets.add(target)
+        for following_id in targets:
+            yield subscriber_id, following_id
+
+
+def generate_tweets(count: int, users: int, days: int, rng: random.Random):
+    activity = ZipfSampler(users, 0.8, rng)
+    started = datetime.now(timezone.utc) - timedelta(days=days)
+    step = timedelta(days=days) / count
+    for tweet_id in range(1, count + 1):
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+        yield tweet_id, content, started + step * tweet_id, activity.sample(), False, 0
+
+
+def generate_likes(count: int, users: int, tweets: int, days: int, exponent: float, rng: random.Random):
+    virality = ZipfSampler(tweets, exponent, rng)
+    now = datetime.now(timezone.utc)
+    started = now - timedelta(days=days)
+    step = timedelta(days=days) / tweets
+    seen = set()
+    for _ in range(count):
+        pair = (rng.randint(1, users), virality.sample())
+        if pair not in seen:
+            seen.add(pair)
+            # Большинство лайков приходит в первые часы после публикации
+            liked_at = min(started + step * pair[1] + timedelta(hours=rng.expovariate(1 / 6)), now)
+            yield pair + (liked_at,)
+
+
+def generate_images(tweets: int, ratio: float, rng: random.Random):
+    image_id = 0
+    for tweet_id in range(1, tweets + 1):
+        if rng.random() < ratio:
+            for _ in range(rng.randint(1, 4)):
+                image_id += 1
+                content_hash = f"{rng.getrandbits(256):064x}"
+                yield image_id, f"api/api/images/{content_hash}.jpg", tweet_id, content_hash, "image/jpeg", 50000
+
+
+async def seed(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    conn = await asyncpg.connect(dsn())
+    try:
+        if args.truncate:
+            await conn.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+
+        steps = (
+            ("users", ("id", "name", "api_key"), generate_users(args.users, rng)),
+            ("association_table", ("subscriber_id", "following_id"),
+             generate_follows(args.users, args.mean_following, args.follower_exponent, rng)),
+            ("tweets", ("id", "content", "created_at", "user_id", "fanout_on_read", "like_count"),
+             generate_tweets(args.tweets, args.users, args.days, rng)),
+            ("likes", ("user_id", "tweet_id", "created_at"),
+             generate_likes(args.likes, args.users, args.tweets, args.days, args.like_exponent, rng)),
+            ("images", ("id", "url", "tweet_id", "content_hash", "content_type", "size"),
+             generate_images(args.tweets, args.media_ratio, rng)),
+        )
+        for table, columns, records in steps:
+            started = time.perf_counter()
+            total = await copy_batches(conn, table, columns, records)
+            print(f"{table:<18} {total:>10} rows  {time.perf_counter() - started:7.1f} s")
+
+        for table in ("users", "tweets", "likes", "images"):
+            await conn.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 1) FROM {table}))"
+            )
+        await conn.execute(
+            "UPDATE tweets SET like_count = counts.like_count "
+            "FROM (SELECT tweet_id, count(*) AS like_count FROM likes GROUP BY tweet_id) AS counts "
+            "WHERE tweets.id = counts.tweet_id"
+        )
+        await conn.execute(
+            "UPDATE tweets SET fanout_on_read = true WHERE user_id IN ("
+            "SELECT following_id FROM association_table GROUP BY following_id HAVING count(*) > $1)",
+            FANOUT_FOLLOWER_LIMIT,
+        )
+        if args.timeline_depth:
+            started = time.perf_counter()
+            status = await conn.execute(
+                "INSERT INTO timelines (user_id, tweet_id, created_at) "
+                "SELECT a.subscriber_id, t.id, t.created_at FROM association_table a "
+                "CROSS JOIN LATERAL (SELECT id, created_at FROM tweets "
+                "WHERE user_id = a.following_id AND NOT fanout_on_read "
+                "ORDER BY created_at DESC, id DESC LIMIT $1) AS t "
+                "UNION ALL "
+                "SELECT u.id, t.id, t.created_at FROM users u "
+                "CROSS JOIN LATERAL (SELECT id, created_at FROM tweets "
+                "WHERE user_id = u.id ORDER BY created_at DESC, id DESC LIMIT $1) AS t "
+                "ON CONFLICT DO NOTHING",
+                args.timeline_depth,
+            )
+            print(f"{'timelines':<18} {status.split()[-1]:>10} rows  {time.perf_counter() - started:7.1f} s")
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--tweets", type=int, default=1000000)
+    parser.add_argument("--likes", type=int, default=3000000)
+    parser.add_argument("--mean-following", type=int, default=50, help="среднее число подписок пользователя")
+    parser.add_argument("--follower-exponent", type=float, default=1.1, help="показатель степени для подписчиков")
+    parser.add_argument("--like-exponent", type=float, default=1.2, help="показатель степени для лайков")
+    parser.add_argument("--media-ratio", type=float, default=0.2, help="доля твитов с картинками")
+    parser.add_argument("--days", type=int, default=365, help="за сколько дней распределены твиты")
+    parser.add_argument("--timeline-depth", type=int, default=TIMELINE_BACKFILL_SIZE,
+                        help="сколько последних твитов каждой подписки и своих твитов разослать в ленты "
+                             "(0 - не строить)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="очистить таблицы перед загрузкой")
+    asyncio.run(seed(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import timedelta
 from io import BytesIO
 
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from api.models import Image, Like, TimelineEntry, User
+
 DATA = {"tweet_data": "Hello, World!", "tweet_media_ids": []}
+PNG_CONTENT = b"\x89PNG\r\n\x1a\n" + b"Hello, World!"
 
 
 async def test_status_200(async_client):
@@ -19,15 +31,48 @@ async def test_create_tweet(async_client):
 
 
 async def test_media_route(async_client):
-    image_content = b"Hello, World!"
-    image_file = BytesIO(image_content)
-    files = {"file": ("test.txt", image_file)}
+    image_file = BytesIO(PNG_CONTENT)
+    files = {"file": ("test.png", image_file)}
     response = await async_client.post("/medias", files=files)
 
     assert response.status_code == 201
     assert response.json() == {"result": True, "media_id": 1}
 
 
+async def test_media_deduplicated(async_client, db_session):
+    first = await async_client.post("/medias", files={"file": ("a.png", BytesIO(PNG_CONTENT))})
+    second = await async_client.post("/medias", files={"file": ("b.png", BytesIO(PNG_CONTENT))})
+    urls = list(await db_session.scalars(select(Image.url).order_by(Image.id)))
+
+    # Файл хранится один раз, но у каждой загрузки своя запись
+    assert first.json()["media_id"] != second.json()["media_id"]
+    assert len(urls) == 2
+    assert urls[0] == urls[1]
+
+
+async def test_media_attached_once(async_client):
+    await upload_png(async_client)
+    first = await async_client.post("/tweets", json={"tweet_data": "First", "tweet_media_ids": [1]})
+    second = await async_client.post("/tweets", json={"tweet_data": "Second", "tweet_media_ids": [1]})
+    missing = await async_client.post("/tweets", json={"tweet_data": "Missing", "tweet_media_ids": [100]})
+    feed = await async_client.get("/tweets")
+
+    assert first.status_code == 201
+    assert second.status_code == 409
+    assert second.json()["error_type"] == "Conflict"
+    assert missing.status_code == 409
+    assert [tweet["content"] for tweet in feed.json()["tweets"]] == ["First"]
+    assert len(feed.json()["tweets"][0]["attachments"]) == 1
+
+
+async def test_media_unsupported_type(async_client):
+    files = {"file": ("test.txt", BytesIO(b"Hello, World!"))}
+    response = await async_client.post("/medias", files=files)
+
+    assert response.status_code == 415
+    assert response.json()["error_type"] == "UnsupportedMediaType"
+
+
 async def test_delete_tweet(async_client):
     response = await async_client.post("/tweets", json=DATA)
     response_delete = await async_client.delete("/tweets/1")
@@ -38,6 +83,19 @@ async def test_delete_tweet(async_client):
     assert len(response_tweets.json()["tweets"]) == 0
 
 
+async def test_delete_tweet_cascades(async_client, db_session):
+    await upload_png(async_client)
+    await async_client.post("/tweets", json={"tweet_data": "With media", "tweet_media_ids": [1]})
+    await async_client.post("/tweets/1/likes")
+    response_delete = await async_client.delete("/tweets/1")
+    likes = await db_session.scalar(select(func.count()).select_from(Like))
+    media_tweet_id = await db_session.scalar(select(Image.tweet_id).where(Image.id == 1))
+
+    assert response_delete.status_code == 200
+    assert likes == 0
+    assert media_tweet_id is None
+
+
 async def test_delete_wrong_tweet(async_client):
     response = await async_client.post("/tweets", json=DATA, headers={"api-key": "test_key"})
     response_delete = await async_client.delete("/tweets/1")
@@ -82,6 +140,32 @@ async def test_follow_user(async_client):
     assert response.json() == {"result": True}
     assert len(response_me.json()["user"]["following"]) == 1
     assert len(response_user.json()["user"]["followers"]) == 1
+    assert response_me.json()["user"]["following_count"] == 1
+    assert response_user.json()["user"]["followers_count"] == 1
+
+
+async def test_followers_pagination(async_client):
+    for index in range(5):
+        await async_client.get("/users/me", headers={"api-key": f"follower_{index}"})
+        await async_client.post("/users/1/follow", headers={"api-key": f"follower_{index}"})
+
+    response_profile = await async_client.get("/users/1")
+    first_page = await async_client.get("/users/1/followers", params={"limit": 3})
+    second_page = await async_client.get(
+        "/users/1/followers", params={"limit": 3, "cursor": first_page.json()["next_cursor"]}
+    )
+    following = await async_client.get("/users/3/following")
+    missing = await async_client.get("/users/100/followers")
+    invalid_cursor = await async_client.get("/users/1/followers", params={"cursor": "%%%"})
+
+    assert response_profile.json()["user"]["followers_count"] == 5
+    assert response_profile.json()["user"]["following_count"] == 0
+    assert [user["id"] for user in first_page.json()["users"]] == [3, 4, 5]
+    assert [user["id"] for user in second_page.json()["users"]] == [6, 7]
+    assert second_page.json()["next_cursor"] is None
+    assert following.json()["users"] == [{"id": 1, "name": "Anton"}]
+    assert missing.status_code == 404
+    assert invalid_cursor.status_code == 400
 
 
 async def test_unfollow_user(async_client):
@@ -113,3 +197,508 @@ async def test_get_user_by_id(async_client):
     assert response.status_code == 200
     assert response.json()["user"]["id"] == 2
     assert response.json()["user"]["name"] == "Ivan"
+
+
+async def test_get_tweets_pagination(async_client):
+    for _ in range(3):
+        await async_client.post("/tweets", json=DATA)
+
+    first_page = await async_client.get("/tweets", params={"limit": 2})
+    cursor = first_page.json()["next_cursor"]
+    second_page = await async_client.get("/tweets", params={"limit": 2, "cursor": cursor})
+
+    assert [tweet["id"] for tweet in first_page.json()["tweets"]] == [3, 2]
+    assert cursor is not None
+    assert [tweet["id"] for tweet in second_page.json()["tweets"]] == [1]
+    assert second_page.json()["next_cursor"] is None
+
+
+async def test_get_tweets_invalid_cursor(async_client):
+    response = await async_client.get("/tweets", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+    assert response.json()["result"] is False
+
+
+async def test_home_timeline(async_client):
+    await async_client.post("/tweets", json=DATA, headers={"api-key": "test_key"})
+    before_follow = await async_client.get("/tweets", params={"feed": "home"})
+    await async_client.post("/users/2/follow")
+    after_follow = await async_client.get("/tweets", params={"feed": "home"})
+    await async_client.post("/tweets", json=DATA, headers={"api-key": "test_key"})
+    await async_client.post("/tweets", json=DATA)
+    after_posts = await async_client.get("/tweets", params={"feed": "home"})
+    await async_client.delete("/users/2/follow")
+    after_unfollow = await async_client.get("/tweets", params={"feed": "home"})
+
+    assert len(before_follow.json()["tweets"]) == 0
+    assert [tweet["id"] for tweet in after_follow.json()["tweets"]] == [1]
+    assert [tweet["id"] for tweet in after_posts.json()["tweets"]] == [3, 2, 1]
+    assert [tweet["id"] for tweet in after_unfollow.json()["tweets"]] == [3]
+
+
+async def test_timeline_trimmer(async_client, db_session):
+    from api.timeline import TimelineTrimmer
+
+    await async_client.post("/users/2/follow")
+    for _ in range(5):
+        await async_client.post("/tweets", json=DATA, headers={"api-key": "test_key"})
+
+    trimmer = TimelineTrimmer(async_sessionmaker(db_session.bind, expire_on_commit=False), max_size=3, batch_size=1)
+    deleted = await trimmer.trim()
+    kept = list(await db_session.scalars(
+        select(TimelineEntry.tweet_id).where(TimelineEntry.user_id == 1).order_by(TimelineEntry.tweet_id)
+    ))
+
+    # Лента автора (5 записей) и подписчика (5 записей) обрезаются до 3 последних
+    assert deleted == 4
+    assert kept == [3, 4, 5]
+
+
+async def test_timeline_trimmer_skips_locked_walk(async_client, db_session):
+    from api.timeline import TRIM_LOCK_KEY, TimelineTrimmer
+
+    for _ in range(5):
+        await async_client.post("/tweets", json=DATA, headers={"api-key": "test_key"})
+
+    trimmer = TimelineTrimmer(async_sessionmaker(db_session.bind, expire_on_commit=False), max_size=3, batch_size=1)
+    async with db_session.bind.connect() as connection:
+        # Блокировка другого воркера держится весь обход, а не одну пачку
+        await connection.scalar(select(func.pg_advisory_lock(TRIM_LOCK_KEY)))
+        skipped = await trimmer.trim()
+        await connection.scalar(select(func.pg_advisory_unlock(TRIM_LOCK_KEY)))
+    deleted = await trimmer.trim()
+
+    assert skipped == 0
+    assert deleted == 2
+
+
+async def test_unknown_api_key(async_client):
+    response = await async_client.post("/tweets", json=DATA, headers={"api-key": "unknown"})
+
+    assert response.status_code == 401
+    assert response.json()["error_type"] == "Unauthorized"
+
+
+async def test_api_key_cache(async_client):
+    from api.auth import user_cache
+
+    await async_client.post("/tweets", json=DATA)
+    await async_client.post("/tweets/1/likes")
+
+    assert user_cache.stats()["misses"] == 1
+    assert user_cache.stats()["hits"] == 1
+
+
+async def test_like_is_idempotent(async_client):
+    await async_client.post("/tweets", json=DATA)
+    first_like = await async_client.post("/tweets/1/likes")
+    second_like = await async_client.post("/tweets/1/likes")
+    response = await async_client.get("/tweets")
+    response_counts = await async_client.get("/tweets", params={"with_likes": False})
+
+    assert first_like.status_code == 201
+    assert second_like.status_code == 201
+    assert len(response.json()["tweets"][0]["likes"]) == 1
+    assert response.json()["tweets"][0]["like_count"] == 1
+    assert "likes" not in response_counts.json()["tweets"][0]
+    assert response_counts.json()["tweets"][0]["like_count"] == 1
+
+
+async def test_feed_likes_are_capped(async_client, db_session):
+    db_session.add_all([User(name=f"Fan {index}", api_key=f"fan-{index}") for index in range(25)])
+    await db_session.commit()
+    await async_client.post("/tweets", json=DATA)
+    for index in range(25):
+        await async_client.post("/tweets/1/likes", headers={"api-key": f"fan-{index}"})
+    response = await async_client.get("/tweets")
+    response_capped = await async_client.get("/tweets", params={"likes_limit": 20})
+
+    tweet = response.json()["tweets"][0]
+    capped = response_capped.json()["tweets"][0]
+    assert len(tweet["likes"]) == 25
+    assert capped["like_count"] == 25
+    assert len(capped["likes"]) == 20
+    assert capped["likes"][0]["name"] == "Fan 0"
+
+
+async def test_like_missing_tweet(async_client):
+    response = await async_client.post("/tweets/100/likes")
+
+    assert response.status_code == 404
+
+
+async def upload_png(async_client) -> str:
+    await async_client.post("/medias", files={"file": ("test.png", BytesIO(PNG_CONTENT))})
+    return f"/api/images/{hashlib.sha256(PNG_CONTENT).hexdigest()}.png"
+
+
+async def test_media_reuses_built_derivatives(async_client, db_session):
+    await upload_png(async_client)
+    await async_client.post("/tweets", json={"tweet_data": "With media", "tweet_media_ids": [1]})
+    await db_session.execute(update(Image).values(
+        thumbnail_url="/thumbnail.png", feed_url="/feed.png", webp_url="/webp.webp"
+    ))
+    await db_session.commit()
+    response = await async_client.post("/medias", files={"file": ("test.png", BytesIO(PNG_CONTENT))})
+    image = await db_session.get(Image, response.json()["media_id"])
+
+    assert image.id == 2
+    assert (image.thumbnail_url, image.feed_url, image.webp_url) == ("/thumbnail.png", "/feed.png", "/webp.webp")
+
+
+async def test_media_reaper(async_client, db_session):
+    from api.media import OUT_PATH
+    from api.media_reaper import MediaReaper
+
+    other_content = PNG_CONTENT + b"other"
+    await upload_png(async_client)
+    await async_client.post("/tweets", json={"tweet_data": "With media", "tweet_media_ids": [1]})
+    await upload_png(async_client)
+    await async_client.post("/medias", files={"file": ("other.png", BytesIO(other_content))})
+    await db_session.execute(update(Image).values(created_at=func.now() - timedelta(days=2)))
+    await db_session.commit()
+    shared_path = OUT_PATH / f"{hashlib.sha256(PNG_CONTENT).hexdigest()}.png"
+    orphan_path = OUT_PATH / f"{hashlib.sha256(other_content).hexdigest()}.png"
+    old = time.time() - 2 * 24 * 3600
+    for path in (shared_path, orphan_path):
+        os.utime(path, (old, old))
+
+    reaper = MediaReaper(async_sessionmaker(db_session.bind, expire_on_commit=False), grace_hours=1, batch_size=1)
+    removed = await reaper.reap()
+    media_ids = list(await db_session.scalars(select(Image.id).order_by(Image.id)))
+
+    assert removed == 1
+    assert media_ids == [1]
+    assert shared_path.exists()
+    assert not orphan_path.exists()
+
+
+async def test_image_repeat_fetch_not_modified(async_client):
+    url = await upload_png(async_client)
+    response = await async_client.get(url)
+    repeat_etag = await async_client.get(url, headers={"if-none-match": response.headers["etag"]})
+    repeat_date = await async_client.get(url, headers={"if-modified-since": response.headers["last-modified"]})
+
+    assert response.status_code == 200
+    assert response.content == PNG_CONTENT
+    assert "immutable" in response.headers["cache-control"]
+    assert repeat_etag.status_code == 304
+    assert repeat_etag.content == b""
+    assert repeat_etag.headers["etag"] == response.headers["etag"]
+    assert repeat_date.status_code == 304
+    assert repeat_date.content == b""
+
+
+async def test_image_range_request(async_client):
+    url = await upload_png(async_client)
+    response = await async_client.get(url, headers={"range": "bytes=0-7"})
+    response_tail = await async_client.get(url, headers={"range": "bytes=-6"})
+    response_outside = await async_client.get(url, headers={"range": "bytes=1000-"})
+
+    assert response.status_code == 206
+    assert response.content == PNG_CONTENT[:8]
+    assert response.headers["content-range"] == f"bytes 0-7/{len(PNG_CONTENT)}"
+    assert response_tail.content == PNG_CONTENT[-6:]
+    assert response_outside.status_code == 416
+
+
+async def test_feed_media_falls_back_to_original(async_client):
+    url = await upload_png(async_client)
+    await async_client.post("/tweets", json={"tweet_data": "With image", "tweet_media_ids": [1]})
+    response = await async_client.get("/tweets")
+    tweet = response.json()["tweets"][0]
+
+    assert tweet["attachments"] == [f"api{url}"]
+    assert tweet["media"][0]["thumbnail"] == tweet["media"][0]["url"]
+
+
+async def test_feed_query_count_does_not_grow(async_client, assert_max_queries):
+    await async_client.get("/users/me")
+    for index in range(10):
+        await async_client.post("/tweets", json={"tweet_data": f"Tweet {index}", "tweet_media_ids": []})
+        await async_client.post(f"/tweets/{index + 1}/likes")
+
+    # Счетчик изменений для ETag и сама страница ленты
+    with assert_max_queries(2):
+        response = await async_client.get("/tweets")
+
+    assert len(response.json()["tweets"]) == 10
+
+
+async def test_feed_not_modified(async_client, assert_max_queries):
+    await async_client.post("/tweets", json=DATA)
+    response = await async_client.get("/tweets")
+    etag = response.headers["etag"]
+
+    with assert_max_queries(1):
+        response_cached = await async_client.get("/tweets", headers={"if-none-match": etag})
+    await async_client.post("/tweets/1/likes")
+    response_after_like = await async_client.get("/tweets", headers={"if-none-match": etag})
+
+    assert response_cached.status_code == 304
+    assert response_cached.content == b""
+    assert response_after_like.status_code == 200
+    assert response_after_like.headers["etag"] != etag
+    assert response_after_like.json()["tweets"][0]["like_count"] == 1
+
+
+async def test_repeated_like_keeps_etag(async_client):
+    await async_client.post("/tweets", json=DATA)
+    await async_client.post("/tweets/1/likes")
+    etag = (await async_client.get("/tweets")).headers["etag"]
+
+    repeat_like = await async_client.post("/tweets/1/likes")
+    after_repeat = await async_client.get("/tweets", headers={"if-none-match": etag})
+    await async_client.delete("/tweets/1/likes")
+    etag = (await async_client.get("/tweets")).headers["etag"]
+    repeat_unlike = await async_client.delete("/tweets/1/likes")
+    after_unlike = await async_client.get("/tweets", headers={"if-none-match": etag})
+
+    assert repeat_like.status_code == 201
+    assert after_repeat.status_code == 304
+    assert repeat_unlike.status_code == 200
+    assert after_unlike.status_code == 304
+
+
+async def test_feed_version_is_sharded(async_client, db_session):
+    from api.models import ChangeVersion
+
+    for _ in range(5):
+        await async_client.post("/tweets", json=DATA)
+    keys = list(await db_session.scalars(select(ChangeVersion.key)))
+    versions = await db_session.scalar(select(func.sum(ChangeVersion.version)))
+
+    assert keys and all(key.startswith("feed:") for key in keys)
+    assert versions == 5
+
+
+async def test_profile_not_modified(async_client):
+    response_me = await async_client.get("/users/me")
+    response_user = await async_client.get("/users/2")
+    cached_me = await async_client.get("/users/me", headers={"if-none-match": response_me.headers["etag"]})
+    cached_other = await async_client.get(
+        "/users/me", headers={"if-none-match": response_me.headers["etag"], "api-key": "test_key"}
+    )
+    await async_client.post("/users/2/follow")
+    after_follow = await async_client.get("/users/2", headers={"if-none-match": response_user.headers["etag"]})
+
+    assert cached_me.status_code == 304
+    assert cached_other.status_code == 200
+    assert after_follow.status_code == 200
+    assert after_follow.json()["user"]["followers"] == [{"id": 1, "name": "Anton"}]
+
+
+async def test_like_query_count(async_client, assert_max_queries):
+    await async_client.post("/tweets", json=DATA)
+
+    with assert_max_queries(2):
+        response = await async_client.post("/tweets/1/likes")
+
+    assert response.status_code == 201
+
+
+async def test_metrics_endpoint(async_client):
+    await async_client.get("/tweets")
+    response = await async_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "db_queries_per_request" in response.text
+    assert 'route="GET /tweets"' in response.text
+
+
+async def test_get_users_batch(async_client):
+    response = await async_client.get("/users", params={"ids": "2,1,100,2"})
+
+    assert response.status_code == 200
+    assert response.json()["users"] == [{"id": 2, "name": "Ivan"}, {"id": 1, "name": "Anton"}]
+    assert response.json()["not_found"] == [100]
+
+
+async def test_batch_ids_out_of_range(async_client):
+    response = await async_client.get("/users", params={"ids": "1,2147483648"})
+    response_zero = await async_client.get("/users", params={"ids": "0"})
+    response_likes = await async_client.post("/tweets/likes", json={"tweet_ids": [1, 2 ** 31]})
+
+    assert response.status_code == 422
+    assert response.json()["result"] is False
+    assert response_zero.status_code == 422
+    assert response_likes.status_code == 422
+
+
+async def test_like_batch(async_client, assert_max_queries):
+    await async_client.get("/users/me")
+    for _ in range(2):
+        await async_client.post("/tweets", json=DATA)
+
+    with assert_max_queries(1):
+        response = await async_client.post("/tweets/likes", json={"tweet_ids": [1, 2, 100]})
+    response_feed = await async_client.get("/tweets")
+    response_unlike = await async_client.request("DELETE", "/tweets/likes", json={"tweet_ids": [1]})
+    response_feed_after = await async_client.get("/tweets")
+
+    assert [item["result"] for item in response.json()["items"]] == [True, True, False]
+    assert response.json()["items"][2]["error_type"] == "NotFound"
+    assert [tweet["like_count"] for tweet in response_feed.json()["tweets"]] == [1, 1]
+    assert response_unlike.json()["items"] == [{"id": 1, "result": True}]
+    assert [tweet["like_count"] for tweet in response_feed_after.json()["tweets"]] == [1, 0]
+
+
+async def test_follow_batch(async_client):
+    response = await async_client.post("/users/follow", json={"user_ids": [2, 100]})
+    response_me = await async_client.get("/users/me")
+    response_unfollow = await async_client.request("DELETE", "/users/follow", json={"user_ids": [2]})
+    response_me_after = await async_client.get("/users/me")
+
+    assert [item["result"] for item in response.json()["items"]] == [True, False]
+    assert response_me.json()["user"]["following"] == [{"id": 2, "name": "Ivan"}]
+    assert response_unfollow.json()["items"][0]["result"] is True
+    assert response_me_after.json()["user"]["following"] == []
+
+
+async def test_follow_suggestions(async_client):
+    await async_client.get("/users/me", headers={"api-key": "third"})
+    await async_client.get("/users/me", headers={"api-key": "fourth"})
+    await async_client.post("/users/follow", json={"user_ids": [2, 3]})
+    await async_client.post("/users/follow", json={"user_ids": [3, 4]}, headers={"api-key": "test_key"})
+    await async_client.post("/users/4/follow", headers={"api-key": "third"})
+
+    response = await async_client.get("/users/me/suggestions")
+    await async_client.post("/users/4/follow")
+    response_after_follow = await async_client.get("/users/me/suggestions")
+
+    assert [(user["id"], user["mutual_count"]) for user in response.json()["users"]] == [(4, 2)]
+    assert response_after_follow.json()["users"] == []
+
+
+async def test_attach_medias_batch(async_client):
+    await upload_png(async_client)
+    await async_client.post("/tweets", json=DATA)
+    response = await async_client.post("/tweets/1/medias", json={"media_ids": [1, 100]})
+    response_wrong_tweet = await async_client.post(
+        "/tweets/1/medias", json={"media_ids": [1]}, headers={"api-key": "test_key"}
+    )
+    feed = await async_client.get("/tweets")
+
+    assert [item["result"] for item in response.json()["items"]] == [True, False]
+    assert response_wrong_tweet.status_code == 400
+    assert len(feed.json()["tweets"][0]["attachments"]) == 1
+
+
+async def test_group_commit_writer(async_client, db_session):
+    from api.group_commit import GroupCommitWriter
+
+    await db_session.commit()
+    writer = GroupCommitWriter(async_sessionmaker(db_session.bind, expire_on_commit=False), max_size=10)
+    tweet_ids = await asyncio.gather(*(writer.add_tweet(1, f"Tweet {index}") for index in range(15)))
+    likes = await asyncio.gather(
+        writer.add_like(2, tweet_ids[0]), writer.add_like(2, tweet_ids[0]), writer.add_like(2, 100)
+    )
+    await writer.shutdown()
+    response = await async_client.get("/tweets", params={"limit": 20})
+    tweets = {tweet["id"]: tweet for tweet in response.json()["tweets"]}
+
+    assert len(set(tweet_ids)) == 15
+    assert [tweets[tweet_id]["content"] for tweet_id in tweet_ids] == [f"Tweet {index}" for index in range(15)]
+    assert likes == [1, 1, None]
+    assert tweets[tweet_ids[0]]["like_count"] == 1
+
+
+async def test_group_commit_isolates_failed_write(async_client, db_session):
+    from api.group_commit import GroupCommitWriter
+
+    await db_session.commit()
+    writer = GroupCommitWriter(async_sessionmaker(db_session.bind, expire_on_commit=False), max_size=10)
+    tweet_id = await writer.add_tweet(1, "Liked")
+    results = await asyncio.gather(
+        writer.add_tweet(1, "Good"),
+        writer.add_tweet(100, "Unknown author"),
+        writer.add_like(2, tweet_id),
+        return_exceptions=True,
+    )
+    await writer.shutdown()
+    response = await async_client.get("/tweets")
+
+    assert isinstance(results[0], int)
+    assert isinstance(results[1], IntegrityError)
+    assert results[2] == 1
+    assert [tweet["content"] for tweet in response.json()["tweets"]] == ["Good", "Liked"]
+
+
+async def test_group_commit_attaches_media_once(async_client, db_session):
+    from api.group_commit import GroupCommitWriter
+    from api.media import MediaError
+
+    db_session.add(Image(url="/api/images/a.png"))
+    await db_session.commit()
+    writer = GroupCommitWriter(async_sessionmaker(db_session.bind, expire_on_commit=False), max_size=10)
+    results = await asyncio.gather(
+        writer.add_tweet(1, "First", [1]), writer.add_tweet(1, "Second", [1]), return_exceptions=True
+    )
+    await writer.shutdown()
+
+    assert isinstance(results[0], int)
+    assert isinstance(results[1], MediaError)
+
+
+async def test_search_tweets(async_client):
+    for content in ("Hello python world", "FastAPI is fast", "Python async python", "Nothing here"):
+        await async_client.post("/tweets", json={"tweet_data": content, "tweet_media_ids": []})
+
+    response = await async_client.get("/tweets/search", params={"q": "pyth"})
+    first_page = await async_client.get("/tweets/search", params={"q": "pyth", "limit": 1})
+    second_page = await async_client.get(
+        "/tweets/search", params={"q": "pyth", "limit": 1, "cursor": first_page.json()["next_cursor"]}
+    )
+    response_recent = await async_client.get("/tweets/search", params={"q": "python", "order": "recent"})
+    response_short = await async_client.get("/tweets/search", params={"q": "is"})
+
+    assert [tweet["content"] for tweet in response.json()["tweets"]] == ["Python async python", "Hello python world"]
+    assert first_page.json()["tweets"][0]["content"] == "Python async python"
+    assert second_page.json()["tweets"][0]["content"] == "Hello python world"
+    assert [tweet["id"] for tweet in response_recent.json()["tweets"]] == [3, 1]
+    assert [tweet["content"] for tweet in response_short.json()["tweets"]] == ["FastAPI is fast"]
+
+
+async def test_search_tweets_invalid_cursor(async_client):
+    response = await async_client.get("/tweets/search", params={"q": "python", "cursor": "broken"})
+
+    assert response.status_code == 400
+
+
+async def test_trending_tweets(async_client, db_session):
+    from api.trending import refresh_trending
+
+    for _ in range(2):
+        await async_client.post("/tweets", json=DATA)
+    await async_client.post("/tweets/1/likes")
+    await async_client.post("/tweets/2/likes")
+    await async_client.post("/tweets/2/likes", headers={"api-key": "test_key"})
+    response = await async_client.get("/tweets/trending")
+
+    await async_client.delete("/tweets/2/likes")
+    await async_client.delete("/tweets/2/likes", headers={"api-key": "test_key"})
+    response_after_unlike = await async_client.get("/tweets/trending")
+
+    await refresh_trending(db_session)
+    response_after_refresh = await async_client.get("/tweets/trending")
+
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [2, 1]
+    assert round(response.json()["tweets"][0]["score"]) == 2
+    assert [tweet["id"] for tweet in response_after_unlike.json()["tweets"]] == [1]
+    assert [tweet["id"] for tweet in response_after_refresh.json()["tweets"]] == [1]
+
+
+async def test_trending_refresh_repeats(async_client, db_session):
+    from api.models import TrendingScore
+    from api.trending import refresh_trending
+
+    await async_client.post("/tweets", json=DATA)
+    await async_client.post("/tweets/1/likes")
+    # Временная таблица свежих оценок удаляется при фиксации транзакции
+    for _ in range(2):
+        assert await refresh_trending(db_session)
+        await db_session.commit()
+    scores = list(await db_session.scalars(select(TrendingScore.tweet_id)))
+
+    assert scores == [1]
@@ -0,0 +1,55 @@
+import gzip
+
+from httpx import AsyncClient, ASGITransport
+
+from api.assets import StaticAssets, precompress
+
+SCRIPT = b"console.log('hello, world');\n" * 100
+
+
+def make_static(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "index.html").write_bytes(b"<html>" + b"<p>index</p>" * 200 + b"</html>")
+    (tmp_path / "js" / "app.0123abcd.js").write_bytes(SCRIPT)
+    return tmp_path
+
+
+async def get(app, path, **headers):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost") as client:
+        return await client.get(path, headers=headers)
+
+
+async def test_assets_negotiate_encoding(tmp_path):
+    app = StaticAssets(make_static(tmp_path))
+    response_br = await get(app, "/js/app.0123abcd.js", **{"accept-encoding": "gzip;q=0.5, br"})
+    response_gzip = await get(app, "/js/app.0123abcd.js", **{"accept-encoding": "gzip, br;q=0"})
+    response_plain = await get(app, "/js/app.0123abcd.js", **{"accept-encoding": "identity"})
+    response_index = await get(app, "/", **{"accept-encoding": "gzip"})
+    response_cached = await get(app, "/", **{"accept-encoding": "gzip", "if-none-match": response_index.headers["etag"]})
+    response_missing = await get(app, "/js/missing.js")
+
+    assert response_br.headers["content-encoding"] == "br"
+    assert response_br.content == SCRIPT
+    assert response_br.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response_gzip.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in response_plain.headers
+    assert response_plain.content == SCRIPT
+    assert response_index.headers["cache-control"] == "no-cache"
+    assert response_index.headers["vary"] == "Accept-Encoding"
+    assert response_cached.status_code == 304
+    assert response_missing.status_code == 404
+    assert app.stats()["hits"] == 4
+
+
+async def test_assets_use_precompressed_files(tmp_path):
+    static = make_static(tmp_path)
+    written = precompress(static)
+    # Подмена файла .gz: сервер должен отдать подготовленный при сборке вариант
+    (static / "js" / "app.0123abcd.js.gz").write_bytes(gzip.compress(b"precompressed"))
+    app = StaticAssets(static)
+    response = await get(app, "/js/app.0123abcd.js", **{"accept-encoding": "gzip"})
+    response_variant = await get(app, "/js/app.0123abcd.js.gz")
+
+    assert written == 4
+    assert response.content == b"precompressed"
+    assert response_variant.status_code == 404
@@ -0,0 +1,44 @@
+import pytest
+
+from api.events import Broker, EventHub, LocalBroker, event_stream
+
+
+async def test_event_hub_delivers_events():
+    hub = EventHub(LocalBroker())
+    stream = event_stream(hub)
+    await stream.__anext__()
+
+    await hub.publish({"type": "tweet_deleted", "tweet_id": 1})
+
+    assert await stream.__anext__() == b'event: tweet_deleted\ndata: {"type":"tweet_deleted","tweet_id":1}\n\n'
+
+
+async def test_event_hub_resets_slow_consumer():
+    hub = EventHub(LocalBroker(), queue_size=2)
+    stream = event_stream(hub)
+    await stream.__anext__()
+
+    for tweet_id in range(3):
+        await hub.publish({"type": "tweet_deleted", "tweet_id": tweet_id})
+
+    assert hub.subscribers == 0
+    assert await stream.__anext__() == b"event: reset\ndata: {}\n\n"
+
+
+async def test_event_stream_unsubscribes_on_disconnect():
+    hub = EventHub(LocalBroker())
+    never_started = event_stream(hub)
+    await never_started.aclose()
+    assert hub.subscribers == 0
+
+    started = event_stream(hub)
+    await started.__anext__()
+    assert hub.subscribers == 1
+    # Клиент отключился до первого события
+    await started.aclose()
+    assert hub.subscribers == 0
+
+
+def test_broker_requires_publish():
+    with pytest.raises(TypeError):
+        Broker()
@@ -0,0 +1,151 @@
+import json
+
+from sqlalchemy import event, text
+
+DATA = {"tweet_data": "Hello, World!", "tweet_media_ids": []}
+
+LARGE_TABLES = {"users", "tweets", "likes", "images", "association_table", "timelines"}
+
+SEED = [
+    "INSERT INTO users (name, api_key) SELECT 'user ' || g, 'key-' || g FROM generate_series(1, 20000) AS g",
+    "INSERT INTO association_table (subscriber_id, following_id) "
+    "SELECT u.id, 1 + (u.id::bigint * k * 7919) % 20000 FROM users u, generate_series(1, 20) AS k "
+    "WHERE u.id <> 1 + (u.id::bigint * k * 7919) % 20000 ON CONFLICT DO NOTHING",
+    "INSERT INTO tweets (content, created_at, user_id, fanout_on_read, like_count) "
+    "SELECT 'tweet ' || g, now() - g * interval '1 second', 1 + g % 20000, false, 0 "
+    "FROM generate_series(1, 200000) AS g",
+    "INSERT INTO likes (user_id, tweet_id) "
+    "SELECT 1 + (g * 31) % 20000, 1 + (g * 17) % 200000 FROM generate_series(1, 200000) AS g "
+    "ON CONFLICT DO NOTHING",
+    "INSERT INTO images (url, tweet_id) SELECT 'api/api/images/' || g || '.png', g * 4 "
+    "FROM generate_series(1, 50000) AS g",
+    "INSERT INTO timelines (user_id, tweet_id, created_at) "
+    "SELECT a.subscriber_id, t.id, t.created_at FROM tweets t "
+    "JOIN association_table a ON a.following_id = t.user_id WHERE t.id % 10 = 0 ON CONFLICT DO NOTHING",
+    "ANALYZE",
+]
+
+
+def seq_scans(node: dict):
+    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+        yield node["Relation Name"]
+    for child in node.get("Plans", []):
+        yield from seq_scans(child)
+
+
+async def test_endpoints_do_not_seq_scan_large_tables(async_client, db_session):
+    await db_session.flush()
+    for statement in SEED:
+        await db_session.execute(text(statement))
+    await db_session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    sync_engine = db_session.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", record)
+    try:
+        feed = await async_client.get("/tweets")
+        await async_client.get("/tweets", params={"cursor": feed.json()["next_cursor"]})
+        await async_client.get("/tweets", params={"feed": "home"})
+        await async_client.get("/tweets/search", params={"q": "12345"})
+        await async_client.get("/tweets/trending")
+        await async_client.get("/tweets/search", params={"q": "12345", "order": "recent"})
+        await async_client.get("/users/me")
+        await async_client.get("/users/3")
+        await async_client.get("/users/3/followers")
+        await async_client.get("/users/3/following")
+        await async_client.post("/users/3/follow")
+        await async_client.delete("/users/3/follow")
+        await async_client.get("/users", params={"ids": "3,4,5"})
+        await async_client.post("/users/follow", json={"user_ids": [3, 4, 5]})
+        await async_client.request("DELETE", "/users/follow", json={"user_ids": [3, 4, 5]})
+        await async_client.get("/users/me/suggestions")
+        tweet = await async_client.post("/tweets", json=DATA)
+        await async_client.post(f"/tweets/{tweet.json()['tweet_id']}/likes")
+        await async_client.delete(f"/tweets/{tweet.json()['tweet_id']}/likes")
+        await async_client.post("/tweets/likes", json={"tweet_ids": [1, 2, tweet.json()["tweet_id"]]})
+        await async_client.request("DELETE", "/tweets/likes", json={"tweet_ids": [1, 2, tweet.json()["tweet_id"]]})
+        await async_client.delete(f"/tweets/{tweet.json()['tweet_id']}")
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record)
+
+    conn = await db_session.connection()
+    offenders = {}
+    for statement, parameters in statements:
+        res = await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+        plan = res.scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        tables = set(seq_scans(plan[0]["Plan"]))
+        if tables:
+            offenders[statement] = tables
+
+    assert statements
+    assert offenders == {}
+
+
+ON_READ_SEED = [
+    "INSERT INTO users (name, api_key) SELECT 'user ' || g, 'key-' || g FROM generate_series(3, 2000) AS g",
+    "INSERT INTO association_table (subscriber_id, following_id) SELECT 1, g FROM generate_series(2, 51) AS g",
+    # Автор с рассылкой при чтении и множеством твитов
+    "INSERT INTO tweets (content, created_at, user_id, fanout_on_read, like_count) "
+    "SELECT 'celebrity ' || g, now() - g * interval '1 second', 2, true, 0 FROM generate_series(1, 50000) AS g",
+    "INSERT INTO tweets (content, created_at, user_id, fanout_on_read, like_count) "
+    "SELECT 'tweet ' || g, now() - g * interval '1 second', 3 + g % 1998, false, 0 "
+    "FROM generate_series(1, 100000) AS g",
+    "INSERT INTO timelines (user_id, tweet_id, created_at) "
+    "SELECT 1, t.id, t.created_at FROM tweets t WHERE t.user_id BETWEEN 3 AND 51",
+    "ANALYZE",
+]
+
+
+def index_rows_read(node: dict, index_name: str) -> int:
+    """Сколько строк узлы плана прочитали по индексу за все повторы (EXPLAIN ANALYZE)"""
+    rows = 0
+    if node.get("Index Name") == index_name:
+        rows += node.get("Actual Rows", 0) * node.get("Actual Loops", 1)
+    for child in node.get("Plans", []):
+        rows += index_rows_read(child, index_name)
+    return rows
+
+
+def index_names(node: dict):
+    if "Index Name" in node:
+        yield node["Index Name"]
+    for child in node.get("Plans", []):
+        yield from index_names(child)
+
+
+async def test_home_feed_reads_on_read_authors_by_page(async_client, db_session):
+    await db_session.flush()
+    for statement in ON_READ_SEED:
+        await db_session.execute(text(statement))
+    await db_session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "author_tweets" in statement:
+            statements.append((statement, parameters))
+
+    sync_engine = db_session.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", record)
+    try:
+        feed = await async_client.get("/tweets", params={"feed": "home"})
+        await async_client.get("/tweets", params={"feed": "home", "cursor": feed.json()["next_cursor"]})
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record)
+
+    assert feed.json()["tweets"][0]["content"] == "celebrity 1"
+    assert len(statements) == 2
+    conn = await db_session.connection()
+    for statement, parameters in statements:
+        res = await conn.exec_driver_sql("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, parameters)
+        plan = res.scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        assert "ix_tweets_fanout_on_read" in set(index_names(plan[0]["Plan"]))
+        assert set(seq_scans(plan[0]["Plan"])) == set()
+        # Читается порядка страницы, а не все 50000 твитов автора
+        assert index_rows_read(plan[0]["Plan"], "ix_tweets_fanout_on_read") < 500